@@ -0,0 +1,112 @@
+"""Batch conversions of several files with a manifest."""
+
+import os
+import json
+import sys
+import subprocess
+from typing import Dict, List, Tuple
+import pytest
+from ts2py import batch, fingerprint, types
+from ts2py.utils.manifest import Manifest
+
+# a.ts and b.ts import each other
+CYCLE = {
+    "a.ts": "import { B } from './b';\nexport interface A { b?: B; }\n",
+    "b.ts": "import { A } from './a';\nexport interface B { a: A; }\n",
+}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def presets():
+    """The presets of "ts2py convert" with its default options."""
+    batch.setup_presets(
+        types.args.PythonCompatibilityArg.PYTHON311,
+        [types.args.PepArg.PEP655],
+        None,
+        False,
+    )
+
+
+def write_package(directory: str, sources: Dict[str, str]) -> List[Tuple[str, str]]:
+    """Writes ``sources`` to the package "pkg" and returns the work list."""
+    package = os.path.join(directory, "pkg")
+    os.makedirs(package, exist_ok=True)
+    with open(os.path.join(package, "__init__.py"), "w", encoding="utf-8"):
+        pass
+    for name, source in sources.items():
+        with open(os.path.join(package, name), "w", encoding="utf-8") as file:
+            file.write(source)
+    filenames = sorted(os.path.join(package, name) for name in sources)
+    return batch.work_list(package, filenames)
+
+
+def convert(work: List[Tuple[str, str]], **kwargs) -> Dict[str, str]:
+    """Converts the files of ``work`` with a manifest and returns the
+    generated code by target."""
+    manifest = Manifest(os.path.dirname(work[0][0]), fingerprint.tool_fingerprint())
+    batch.batch_process(work, manifest=manifest, **kwargs)
+    results = {}
+    for _, target in work:
+        with open(target, "r", encoding="utf-8") as file:
+            results[os.path.basename(target)] = file.read()
+    return results
+
+
+def import_package(directory: str) -> None:
+    """Imports the generated modules in a fresh interpreter."""
+    subprocess.run(
+        [sys.executable, "-c", "import pkg.a, pkg.b"], cwd=directory, check=True
+    )
+
+
+def test_import_cycle_stays_importable(tmp_path):
+    work = write_package(str(tmp_path), CYCLE)
+    first = convert(work)
+    import_package(str(tmp_path))
+    assert convert(work, force=True) == first
+    import_package(str(tmp_path))
+
+
+@pytest.mark.parametrize(
+    "versions",
+    [
+        # edits of the files of an import cycle
+        [
+            CYCLE,
+            {"a.ts": CYCLE["a.ts"] + "export interface C { b: B; }\n"},
+            {
+                "b.ts": "import { A, C } from './a';\n"
+                "export interface B { a: A; c?: C; }\n"
+            },
+        ],
+        # an edit that closes an import cycle, so that a.ts follows b.ts
+        [
+            {
+                "a.ts": "export interface A { n: number; }\n",
+                "b.ts": "import { A } from './a';\nexport interface B { a: A; }\n",
+            },
+            {"a.ts": CYCLE["a.ts"]},
+        ],
+    ],
+)
+def test_incremental_conversion_of_import_cycle(tmp_path, versions):
+    sources: Dict[str, str] = {}
+    incremental = str(tmp_path / "incremental")
+    for number, edits in enumerate(versions):
+        sources.update(edits)
+        results = convert(write_package(incremental, sources))
+        rebuild = str(tmp_path / f"rebuild{number}")
+        assert results == convert(write_package(rebuild, sources))
+        import_package(incremental)
+
+
+def test_profile_bypasses_the_manifest(tmp_path, capsys):
+    work = write_package(str(tmp_path), CYCLE)
+    convert(work)
+    capsys.readouterr()
+    convert(work, profile=True)
+    records = [json.loads(line) for line in capsys.readouterr().err.splitlines()]
+    assert sorted(os.path.basename(record["file"]) for record in records) == [
+        "a.ts",
+        "b.ts",
+    ]
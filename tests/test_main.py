@@ -0,0 +1,25 @@
+"""The programmatic entry points of older versions in ts2py.main."""
+
+import sys
+import subprocess
+import pytest
+
+
+def test_import_of_main_does_not_load_dhparser():
+    code = (
+        "import sys, ts2py.main, ts2py.types\n"
+        "assert 'DHParser' not in sys.modules, 'DHParser has been loaded'\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_moved_entry_points_are_forwarded():
+    from ts2py import api, batch, main, types
+
+    with pytest.deprecated_call():
+        assert main.compile_src is api.compile_src
+    with pytest.deprecated_call():
+        assert main.serialize_result is api.serialize_result
+    with pytest.deprecated_call():
+        assert main.process_file is batch.process_file
+    assert types.dhparser.PreprocessorFunc
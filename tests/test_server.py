@@ -0,0 +1,32 @@
+"""Start-up of the conversion server on an existing path."""
+
+import os
+import socket
+import pytest
+from ts2py.server import remove_stale_socket
+
+
+def test_stale_socket_is_removed(tmp_path):
+    path = str(tmp_path / "ts2py.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(path)  # bound, but not listening
+    remove_stale_socket(path)
+    assert not os.path.exists(path)
+
+
+def test_socket_of_running_server_is_kept(tmp_path):
+    path = str(tmp_path / "ts2py.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as running:
+        running.bind(path)
+        running.listen()
+        with pytest.raises(FileExistsError):
+            remove_stale_socket(path)
+    assert os.path.exists(path)
+
+
+def test_other_files_are_kept(tmp_path):
+    path = tmp_path / "ts2py.sock"
+    path.write_text("not a socket")
+    with pytest.raises(FileExistsError):
+        remove_stale_socket(str(path))
+    assert path.read_text() == "not a socket"
@@ -1,3 +1,21 @@
 __title__ = "ts2py"
 __version__ = "0.0.2"
 __description__ = "Python-Interoperability for Typescript-Interfaces"
+
+API = (
+    "convert_many",
+    "convert_source",
+    "convert_async",
+    "convert_many_async",
+    "Options",
+    "ConversionResult",
+)
+
+
+def __getattr__(name):
+    # the conversion API is imported on first use, since it loads the grammar
+    if name in API:
+        from ts2py import api  # pylint: disable=import-outside-toplevel
+
+        return getattr(api, name)
+    raise AttributeError(f"module 'ts2py' has no attribute '{name}'")
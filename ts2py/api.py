@@ -0,0 +1,254 @@
+"""Conversion of TypeScript sources that are held in memory.
+
+The options of a conversion are passed explicitly instead of being read
+from the (process-wide) presets, so that callers with different options
+can share one process::
+
+    from ts2py import convert_many, Options
+
+    for result in convert_many(sources, Options(use_type_union=True)):
+        print(result.name, result.errors)
+
+``convert_async()`` and ``convert_many_async()`` do the same for asyncio
+applications without blocking the event loop.
+"""
+
+import os
+import asyncio
+import collections
+import concurrent.futures
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Deque, Dict
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from DHParser import (
+    access_thread_locals,
+    compile_source,
+    canonical_error_strings,
+    get_config_value,
+    has_errors,
+    set_config_value,
+    Error,
+    StringView,
+    FATAL,
+)
+from ts2py.syntax import preprocessor, ast, parser, compiler, fastpath, chunking
+from ts2py.profiling import Profile, TimedStage, TimedCompiler
+
+
+def compile_src(
+    source: str,
+    write: Optional[Callable[[str], Any]] = None,
+    profile: Optional[Profile] = None,
+    imports: Optional[compiler.ModuleImports] = None,
+) -> Tuple[Any, List[Error]]:
+    """
+    Compiles ``source`` and returns (result, errors). If ``write`` is given,
+    the code of the top-level declarations is passed to ``write`` while it
+    is being compiled and the result only contains the import header. If
+    a ``profile`` is given, the stages are timed and recorded in it.
+    ``imports`` are the types that ``source`` imports from other modules.
+    """
+    ts2py_compiler = compiler.get_compiler()
+    grammar = parser.get_grammar()
+    if get_config_value("ts2py.FastPath", False):
+        grammar = fastpath.FastPathParser(grammar)
+    chunk_size = get_config_value("ts2py.ChunkSize", 0)
+    if chunk_size > 0:
+        grammar = chunking.ChunkedParser(grammar, chunk_size)
+    stages = [
+        preprocessor.get_preprocessor(),
+        grammar,
+        ast.get_transformer(),
+        partial(ts2py_compiler.stream, write=write) if write else ts2py_compiler,
+    ]
+    if profile:
+        stages = [
+            TimedStage(profile, "preprocessor", stages[0]),
+            TimedStage(profile, "parser", stages[1], "cst"),
+            TimedStage(profile, "transformer", stages[2], "ast"),
+            TimedCompiler(profile, stages[3], ts2py_compiler),
+        ]
+    ts2py_compiler.imports = imports
+    try:
+        result_tuple = compile_source(source, *stages)
+    finally:
+        ts2py_compiler.imports = None
+    return result_tuple[:2]  # drop the AST at the end of the result tuple
+
+
+def serialize_result(result: Any) -> str:
+    """
+    Serialize the result
+    """
+    if isinstance(result, (str, StringView)):
+        return str(result)
+    return repr(result)
+
+
+class Options(NamedTuple):
+    """Options of a conversion, cf. the [ts2py]-section of ts2pyParser.ini."""
+
+    base_class_name: str = "TypedDict"
+    class_decorator: str = ""
+    use_enum: bool = True
+    use_type_union: bool = False
+    use_literal_type: bool = True
+    use_not_required: bool = True
+    fast_path: bool = False
+
+    def config_values(self) -> Dict[str, Any]:
+        return {
+            "ts2py.BaseClassName": self.base_class_name,
+            "ts2py.ClassDecorator": self.class_decorator,
+            "ts2py.UseEnum": self.use_enum,
+            "ts2py.UseTypeUnion": self.use_type_union,
+            "ts2py.UseLiteralType": self.use_literal_type,
+            "ts2py.UseNotRequired": self.use_not_required,
+            "ts2py.FastPath": self.fast_path,
+        }
+
+
+@contextmanager
+def thread_config(values: Dict[str, Any]) -> Iterator[None]:
+    """Sets ``values`` as thread-local configuration values for the duration
+    of the with-block and restores the previous values of the thread."""
+    thread_locals = access_thread_locals()
+    previous = dict(getattr(thread_locals, "config", {}))
+    for key, value in values.items():
+        set_config_value(key, value, allow_new_key=True)
+    try:
+        yield
+    finally:
+        config = thread_locals.config
+        for key in values:
+            if key in previous:
+                config[key] = previous[key]
+            else:
+                config.pop(key, None)
+
+
+class ConversionResult(NamedTuple):
+    name: str
+    python: Optional[str]  # None, if fatal errors have occurred
+    errors: List[str]
+
+
+def convert_source(
+    name: str, source: str, options: Options = Options()
+) -> ConversionResult:
+    """
+    Converts a single ``source`` in the current thread. The options are set
+    as thread-local configuration values for the time of the conversion, so
+    the presets and the configuration of the thread remain untouched.
+    """
+    if source.find("\n") < 0:
+        source += "\n"  # never let DHParser mistake the source for a file name
+    with thread_config(options.config_values()):
+        result, errors = compile_src(source)
+    return ConversionResult(
+        name,
+        None if has_errors(errors, FATAL) else serialize_result(result),
+        canonical_error_strings(errors),
+    )
+
+
+def convert_many(
+    sources: Iterable[Tuple[str, str]],
+    options: Options = Options(),
+    executor: Union[str, concurrent.futures.Executor] = "thread",
+    max_workers: Optional[int] = None,
+) -> Iterator[ConversionResult]:
+    """
+    Converts (name, source)-pairs and yields their results in the order of
+    ``sources``. ``executor`` is "thread" or "process" for a pool that
+    lives as long as the iteration, "single" for converting in the calling
+    thread, or an existing executor. Only a bounded number of sources is
+    submitted ahead of the results consumed, so ``sources`` may well be a
+    generator over more sources than fit into memory at once.
+    """
+    if executor == "single":
+        for name, source in sources:
+            yield convert_source(name, source, options)
+        return
+    if isinstance(executor, concurrent.futures.Executor):
+        pool, owned = executor, False
+    elif executor == "thread":
+        pool, owned = concurrent.futures.ThreadPoolExecutor(max_workers), True
+    elif executor == "process":
+        pool, owned = concurrent.futures.ProcessPoolExecutor(max_workers), True
+    else:
+        raise ValueError(f"Unknown executor '{executor}'")
+    window = 2 * (max_workers or os.cpu_count() or 1)
+    pending: Deque[concurrent.futures.Future] = collections.deque()
+    try:
+        for name, source in sources:
+            pending.append(pool.submit(convert_source, name, source, options))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if owned:
+            pool.shutdown()
+
+
+async def convert_async(
+    name: str,
+    source: str,
+    options: Options = Options(),
+    executor: Optional[concurrent.futures.Executor] = None,
+) -> ConversionResult:
+    """
+    Converts ``source`` on ``executor`` or on the event loop's default
+    executor. Every worker thread keeps its own grammar, transformer and
+    compiler, so only the first conversion in a thread pays for them. The
+    number of simultaneous conversions is bounded by the executor's
+    workers.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, convert_source, name, source, options)
+
+
+async def _aiter(
+    sources: Union[Iterable[Tuple[str, str]], AsyncIterable[Tuple[str, str]]]
+) -> AsyncIterator[Tuple[str, str]]:
+    if isinstance(sources, AsyncIterable):
+        async for item in sources:
+            yield item
+    else:
+        for item in sources:
+            yield item
+
+
+async def convert_many_async(
+    sources: Union[Iterable[Tuple[str, str]], AsyncIterable[Tuple[str, str]]],
+    options: Options = Options(),
+    executor: Optional[concurrent.futures.Executor] = None,
+    concurrency: int = 4,
+) -> AsyncIterator[ConversionResult]:
+    """
+    Converts (name, source)-pairs from a synchronous or an asynchronous
+    iterable and yields their results in the order of ``sources``, e.g.
+    ``async for result in convert_many_async(sources): ...``. At most
+    ``concurrency`` conversions are under way at any time and no further
+    sources are read until the consumer has taken the oldest result.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    loop = asyncio.get_running_loop()
+    pending: Deque[asyncio.Future] = collections.deque()
+    try:
+        async for name, source in _aiter(sources):
+            pending.append(
+                loop.run_in_executor(executor, convert_source, name, source, options)
+            )
+            if len(pending) >= concurrency:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for future in pending:
+            future.cancel()
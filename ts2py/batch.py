@@ -0,0 +1,397 @@
+"""Conversion of files on disk: presets from the command line options,
+discovery of the sources, the manifest of up-to-date files and the
+(parallel) conversion itself. The CLI imports this module only when a
+command runs, so that ``ts2py --help`` does not load DHParser.
+"""
+
+import os
+import sys
+import json
+import heapq
+import shutil
+import tempfile
+import concurrent.futures
+from typing import List, Tuple, Dict, Optional, Set
+from DHParser import (
+    set_config_value,
+    get_config_value,
+    finalize_presets,
+    canonical_error_strings,
+    has_errors,
+    FATAL,
+    set_preset_value,
+    read_local_config,
+    access_presets,
+    md5,
+)
+from DHParser.toolkit import instantiate_executor, SingleThreadExecutor
+from ts2py.syntax import compiler
+from ts2py import fingerprint, modules, types
+from ts2py.utils import helper
+from ts2py.utils.config import INI_FILE
+from ts2py.utils.logger import Logger
+from ts2py.utils.manifest import Manifest
+from ts2py.utils.result_cache import get_result_cache
+from ts2py.api import compile_src, serialize_result
+from ts2py.profiling import Profile
+
+
+def process_file(
+    source: str,
+    target: str,
+    stream: bool = False,
+    profile: bool = False,
+    imports: Optional[compiler.ModuleImports] = None,
+    cached: bool = True,
+) -> Tuple[List[str], Optional[Dict], compiler.ModuleSymbols]:
+    """
+    Compiles the source and writes the serialized results back to disk,
+    unless any fatal errors have occurred. Error and Warning messages are
+    returned as canonical error strings, so that they can be reported by
+    the calling process, together with the profile of the conversion, if
+    ``profile`` is set, and the top-level types of the source for the files
+    that import it. With ``stream`` the generated code is buffered in a
+    temporary file declaration by declaration instead of being kept in
+    memory as a whole. ``imports`` are the types the source imports.
+    If a result cache has been configured, the result is taken from the
+    cache, if ``cached`` is set and ``profile`` is not, and stored in it
+    otherwise, cf. ``result_cache.ResultCache``.
+    """
+    if os.path.isfile(target):
+        os.remove(target)
+    file_profile = Profile(source) if profile else None
+    result_cache = get_result_cache()
+    if result_cache:
+        with open(source, "r", encoding="utf-8") as source_file:
+            key = result_cache.key(
+                source_file.read(),
+                fingerprint.tool_fingerprint(),
+                imports_hash(imports),
+            )
+        use_entry = cached and not profile
+        entry = result_cache.restore(key, source, target) if use_entry else None
+        if entry is not None:
+            Logger().info(f"Restored '{target}' from the result cache")
+            errors, symbols = entry
+            return canonical_error_strings(errors), None, symbols
+    if not stream:
+        result, errors = compile_src(source, profile=file_profile, imports=imports)
+        if not has_errors(errors, FATAL):
+            with open(target, "w", encoding="utf-8") as results_file:
+                results_file.write(serialize_result(result))
+    else:
+        with tempfile.TemporaryFile(
+            "w+", encoding="utf-8", dir=os.path.dirname(target) or None
+        ) as body_file:
+            header, errors = compile_src(source, body_file.write, file_profile, imports)
+            if not has_errors(errors, FATAL):
+                body_file.seek(0)
+                with open(target, "w", encoding="utf-8") as results_file:
+                    results_file.write(serialize_result(header))
+                    shutil.copyfileobj(body_file, results_file)
+    fatal = has_errors(errors, FATAL)
+    symbols = compiler.ModuleSymbols() if fatal else compiler.get_compiler().symbols()
+    if result_cache:
+        result_cache.store(key, errors, fatal, symbols, target)
+    return (
+        canonical_error_strings(errors),
+        file_profile.as_dict() if file_profile else None,
+        symbols,
+    )
+
+
+def imports_hash(imports: Optional[compiler.ModuleImports]) -> str:
+    """A hash of the imported types, which the generated code depends on."""
+    if imports is None:
+        return ""
+    return md5(
+        imports.code,
+        repr(sorted(imports.symbols.types)),
+        repr(sorted(imports.symbols.typed_dicts)),
+    )
+
+
+def report_result(source: str, error_strings: List[str]) -> None:
+    """
+    Prints the Error and Warning messages of a processed file in the
+    terminal output.
+    """
+    if error_strings:
+        Logger().error("\n".join(error_strings))
+    else:
+        Logger().success(f"Conversion for file '{source}' completed succesfully")
+
+
+def read_source_hash(filename: str) -> str:
+    with open(filename, "r", encoding="utf-8") as source_file:
+        return compiler.source_hash(source_file.read())
+
+
+def parses_in_chunks(filename: str) -> bool:
+    """Whether the file is large enough to be parsed in parallel chunks,
+    cf. ``chunking.ChunkedParser``."""
+    chunk_size = get_config_value("ts2py.ChunkSize", 0)
+    return chunk_size > 0 and os.path.getsize(filename) >= 2 * chunk_size
+
+
+def batch_process(
+    work: List[Tuple[str, str]],
+    jobs: int = 1,
+    manifest: Optional[Manifest] = None,
+    force: bool = False,
+    stream: bool = False,
+    profile: bool = False,
+    context: Optional[List[Tuple[str, str]]] = None,
+) -> None:
+    """
+    Compiles all (source, target)-pairs listed in ``work``. Files that
+    import other files are compiled after them, so that the imported types
+    are known, cf. ``modules.ModuleGraph``. ``context`` are all (source,
+    target)-pairs of the conversion, if ``work`` is only a part of them.
+    If ``jobs`` is greater than one, the files are distributed over a pool
+    of worker processes, each of which keeps its own grammar- and compiler-
+    singletons for all files it processes. Results are reported in the
+    order of ``context`` or ``work``.
+    If a ``manifest`` is given, files whose source hash has not changed
+    since their last conversion are skipped, unless ``force`` is set or
+    the types they import from other files have changed, e.g. if a file
+    imports an interface that has been added to or removed from another
+    file. Files of the ``context`` are only compiled in the latter case.
+    ``force`` also bypasses the result cache, if one has been configured.
+    ``stream`` and ``profile`` are passed on to ``process_file()``; the
+    profiles are printed as JSON lines to stderr. Like ``force``, ``profile``
+    bypasses the manifest and the result cache, so that every file is
+    converted and profiled.
+    """
+    set_config_value("batch_processing_parallelization", jobs > 1)
+    targets = dict(context or work)
+    targets.update(work)
+    requested = {filename for filename, _ in work}
+    graph = modules.ModuleGraph(list(targets.items()))
+    # top-level types of the files, as far as they are known
+    symbols: Dict[str, compiler.ModuleSymbols] = {}
+    if manifest:
+        for filename in targets:
+            file_symbols = manifest.symbols(filename)
+            if file_symbols is not None:
+                symbols[filename] = file_symbols
+    # types of the converted files that have been added, removed or have
+    # become or ceased to be TypedDicts
+    changes: Dict[str, Set[str]] = {}
+
+    def is_affected(filename: str) -> bool:
+        """Whether the types that ``filename`` imports have changed."""
+        uses = manifest.uses(filename) if manifest else None
+        if manifest is None or uses is None:
+            return manifest is not None
+        dependencies = {
+            manifest.key(dep): dep
+            for dep in graph.preceding_dependencies(filename, rank)
+        }
+        if set(uses) != set(dependencies):
+            return True
+        for key, names in uses.items():
+            changed = changes.get(dependencies[key])
+            if changed and ("*" in names or changed.intersection(names)):
+                return True
+        return False
+
+    # a file is due as soon as the files it imports are done, except for
+    # those that follow it because of an import cycle
+    order = graph.order(list(targets))
+    rank = {filename: i for i, filename in enumerate(order)}
+    blocking: Dict[str, int] = {}
+    dependents: Dict[str, List[str]] = {filename: [] for filename in order}
+    for filename in order:
+        dependencies = graph.preceding_dependencies(filename, rank)
+        blocking[filename] = len(dependencies)
+        for dependency in dependencies:
+            dependents[dependency].append(filename)
+    due = [(rank[filename], filename) for filename in order if not blocking[filename]]
+
+    def done(filename: str) -> None:
+        for dependent in dependents[filename]:
+            blocking[dependent] -= 1
+            if not blocking[dependent]:
+                heapq.heappush(due, (rank[dependent], dependent))
+
+    source_hashes: Dict[str, str] = {}
+    # filename -> (messages, profile, converted) or None, if not reported
+    outcomes: Dict[str, Optional[Tuple[List[str], Optional[Dict], bool]]] = {}
+    reported = 0
+    files = list(targets)
+    with instantiate_executor(
+        get_config_value("batch_processing_parallelization"),
+        concurrent.futures.ProcessPoolExecutor,
+        max_workers=jobs,
+        initializer=fingerprint.share,
+        initargs=(fingerprint.tool_hash(),),
+    ) as pool:
+        inline = SingleThreadExecutor()
+        running: Dict[concurrent.futures.Future, str] = {}
+        while due or running:
+            while due:
+                _, filename = heapq.heappop(due)
+                target = targets[filename]
+                source_hash = read_source_hash(filename) if manifest else ""
+                source_hashes[filename] = source_hash
+                error_strings = None
+                # profiling an up-to-date file means converting it all the same
+                if manifest and not (force or profile) and os.path.isfile(target):
+                    error_strings = manifest.lookup(filename, source_hash)
+                up_to_date = error_strings is not None and filename in symbols
+                if filename not in requested or up_to_date:
+                    if not is_affected(filename):
+                        if filename in requested:
+                            outcomes[filename] = (error_strings, None, False)
+                        else:
+                            outcomes[filename] = None
+                        done(filename)
+                        continue
+                if os.path.isfile(target):
+                    Logger().info(
+                        f"Target file '{target}' already exists, deleting it..."
+                    )
+                else:
+                    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+                imports = graph.module_imports(filename, symbols, rank)
+                args = (filename, target, stream, profile, imports, not force)
+                # files that are parsed in chunks by a pool of their own are
+                # converted in this process, so that process pools are not nested
+                executor = inline if jobs > 1 and parses_in_chunks(filename) else pool
+                running[executor.submit(process_file, *args)] = filename
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                filename = running.pop(future)
+                try:
+                    error_strings, file_profile, file_symbols = future.result()
+                except Exception as err:  # pylint: disable=broad-except
+                    error_strings = [f"Conversion of '{filename}' crashed: {err!r}"]
+                    file_profile, file_symbols = None, compiler.ModuleSymbols()
+                previous = symbols.get(filename, compiler.ModuleSymbols())
+                exports = graph.exports(filename, file_symbols, symbols, rank)
+                changes[filename] = (previous.types ^ exports.types) | (
+                    previous.typed_dicts ^ exports.typed_dicts
+                )
+                symbols[filename] = exports
+                outcomes[filename] = (error_strings, file_profile, True)
+                if manifest:
+                    if os.path.isfile(targets[filename]):
+                        manifest.update(
+                            filename,
+                            source_hashes[filename],
+                            error_strings,
+                            exports,
+                            graph.uses(filename, file_symbols.references, rank),
+                        )
+                    else:
+                        manifest.discard(filename)
+                done(filename)
+            while reported < len(files) and files[reported] in outcomes:
+                outcome = outcomes.pop(files[reported])
+                if outcome is not None:
+                    error_strings, file_profile, converted = outcome
+                    if converted:
+                        report_result(files[reported], error_strings)
+                    else:
+                        Logger().info(
+                            f"File '{files[reported]}' is up to date, skipping it..."
+                        )
+                        if error_strings:
+                            report_result(files[reported], error_strings)
+                    if file_profile:
+                        # on stderr, so the records are not mixed with the log
+                        print(json.dumps(file_profile), file=sys.stderr, flush=True)
+                reported += 1
+    if manifest:
+        manifest.save()
+    result_cache = get_result_cache()
+    if result_cache:
+        result_cache.prune()
+
+
+def setup_presets(
+    compatibility: types.args.PythonCompatibilityArg,
+    peps: List[types.args.PepArg],
+    decorator: Optional[str],
+    debug: bool,
+    fast_path: bool = False,
+    memoization: Optional[types.args.MemoizationArg] = None,
+    chunk_size: Optional[int] = None,
+    cache_dir: Optional[str] = None,
+) -> None:
+    """
+    Reads the local configuration and sets the presets derived from the
+    command line options.
+    """
+    read_local_config(INI_FILE)
+    access_presets()
+
+    # Set PEPS
+    for pep in peps:
+        kwargs = {"value": True, "allow_new_key": True}
+        if pep == types.args.PepArg.PEP435:
+            set_preset_value("ts2py.UseEnum", **kwargs)
+        if pep == types.args.PepArg.PEP584:
+            set_preset_value("ts2py.UseLiteralType", **kwargs)
+        if pep == types.args.PepArg.PEP604:
+            set_preset_value("ts2py.TypeUnion", **kwargs)
+        if pep == types.args.PepArg.PEP655:
+            set_preset_value("ts2py.UseNotRequired", **kwargs)
+    # Set compatibility
+    if helper.use_type_union(compatibility):
+        set_preset_value("ts2py.UseTypeUnion", True, allow_new_key=True)
+    # Set decorator
+    if decorator:
+        set_preset_value("ts2py.ClassDecorator", decorator)
+    # Set fast path
+    if fast_path:
+        set_preset_value("ts2py.FastPath", True, allow_new_key=True)
+    # Set memoization policy
+    if memoization:
+        set_preset_value("ts2py.Memoization", memoization.value, allow_new_key=True)
+    # Set chunked parsing of large files
+    if chunk_size is not None:
+        set_preset_value("ts2py.ChunkSize", chunk_size, allow_new_key=True)
+    # Set the directory of the result cache
+    if cache_dir is not None:
+        set_preset_value("ts2py.ResultCache", cache_dir, allow_new_key=True)
+    # Set debug mode
+    if debug:
+        set_preset_value("history_tracking", True)
+        set_preset_value("resume_notices", True)
+        set_preset_value(
+            "log_syntax_trees", frozenset(["cst", "ast"])
+        )  # don't use a set literal, here
+    finalize_presets()
+
+
+def collect_filenames(
+    path: str, include: List[str], exclude: List[str]
+) -> Tuple[str, List[str]]:
+    """
+    Returns the root directory of ``path`` and the files to convert, i.e.
+    ``path`` itself or all files below it that match the glob patterns.
+    """
+    if os.path.isdir(path):
+        return path, helper.find_files(path, include, exclude)
+    return os.path.dirname(path) or ".", [path]
+
+
+def work_list(
+    directory: str, filenames: List[str], out_dir: Optional[str] = None
+) -> List[Tuple[str, str]]:
+    """
+    Pairs every file with its target. The targets are placed next to the
+    sources or, if ``out_dir`` is given, at the same relative path below
+    ``out_dir`` as the sources below ``directory``.
+    """
+    work = []
+    for filename in filenames:
+        target = f"{filename[:-3]}.py"
+        if out_dir:
+            target = os.path.join(out_dir, os.path.relpath(target, directory))
+        work.append((filename, target))
+    return work
@@ -0,0 +1,340 @@
+"""Synthetic TypeScript corpora and per-stage measurements of the
+ts2py-pipeline (preprocessor, parser, AST-transformation, compiler).
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+from DHParser import Node, get_config_value
+from ts2py.syntax import preprocessor, ast, parser, compiler, fastpath
+
+
+def gen_interfaces(size: int, _depth: int) -> str:
+    interfaces = []
+    for i in range(size):
+        interfaces.append(
+            f"""export interface Item{i} {{
+  id: integer;
+  name: string;
+  tags?: string[];
+  next?: Item{i + 1};
+  previous: Item{max(i - 1, 0)} | null;
+  kind: 'a' | 'b' | 'c';
+  callback: (value: Item{i}, index: number) => void;
+}}
+"""
+        )
+    return "\n".join(interfaces)
+
+
+def gen_unions(size: int, _depth: int) -> str:
+    members = " | ".join(f"Member{i}" for i in range(size))
+    return (
+        f"export interface WideUnion {{\n  value: {members};\n}}\n\n"
+        f"export type WideAlias = {members};\n"
+    )
+
+
+def gen_nesting(size: int, depth: int) -> str:
+    interfaces = []
+    for i in range(size):
+        lines = [f"export interface Nested{i} {{"]
+        for level in range(depth):
+            lines.append("  " * (level + 1) + f"level{level}: {{")
+        lines.append("  " * (depth + 1) + "leaf: string;")
+        for level in reversed(range(depth)):
+            lines.append("  " * (level + 1) + "};")
+            lines.append("  " * (level + 1) + f"sibling{level}?: number;")
+        lines.append("}\n")
+        interfaces.append("\n".join(lines))
+    return "\n".join(interfaces)
+
+
+def gen_generics(size: int, _depth: int) -> str:
+    interfaces = []
+    for i in range(size):
+        interfaces.append(
+            f"""export interface Container{i}<T> {{
+  value: T;
+  items: T[];
+  map: {{ [key: string]: T }};
+}}
+
+export interface Derived{i} extends Container{i}<string> {{
+  extra: Container{i}<number>;
+  pairs: Array<[string, number]>;
+}}
+"""
+        )
+    return "\n".join(interfaces)
+
+
+def gen_enums(size: int, _depth: int) -> str:
+    enums = []
+    for i in range(size):
+        if i % 2:
+            enums.append(f"export enum Enum{i} {{ A = 'a', B = 'b', C = 'c' }}\n")
+        else:
+            enums.append(f"export enum Enum{i} {{ A = 1, B = 2, C = 3 }}\n")
+    return "\n".join(enums)
+
+
+def gen_namespaces(size: int, _depth: int) -> str:
+    namespaces = []
+    for i in range(size):
+        namespaces.append(
+            f"""export namespace Kind{i} {{
+  export const A: 1 = 1;
+  export const B: 2 = 2;
+}}
+
+export namespace Api{i} {{
+  export interface Params {{ id: integer; }}
+  export function call(params: Params): string;
+}}
+"""
+        )
+    return "\n".join(namespaces)
+
+
+def gen_references(size: int, depth: int) -> str:
+    interfaces = []
+    for i in range(size):
+        lines = [f"export interface Ref{i}<T> {{"]
+        for level in range(depth):
+            indent = "  " * (level + 1)
+            lines.append(f"{indent}link{level}: Ref{max(i - 1, 0)}<T> | Item{i} | T;")
+            lines.append(f"{indent}level{level}: {{")
+        lines.append("  " * (depth + 1) + f"leaf: Ref{i // 2}<string>[];")
+        for level in reversed(range(depth)):
+            lines.append("  " * (level + 1) + "};")
+        lines.append("}\n")
+        interfaces.append("\n".join(lines))
+    return "\n".join(interfaces)
+
+
+def gen_callbacks(size: int, depth: int) -> str:
+    emitters = []
+    for i in range(size):
+        callback = "(error: Error | null) => void"
+        for level in range(depth):
+            callback = f"(value{level}: Item{i}, done: {callback}) => void"
+        emitters.append(
+            f"export interface Emitter{i} {{\n"
+            f"  on(event: string, listener: {callback}): Emitter{i};\n"
+            f"  off(event: string, listener: (...args: any[]) => void): void;\n"
+            f"  handlers: {{ [name: string]: (params: Item{i}, cb: {callback}) => void"
+            " };\n"
+            "}\n"
+        )
+    return "\n".join(emitters)
+
+
+SHAPES: Dict[str, Callable[[int, int], str]] = {
+    "interfaces": gen_interfaces,
+    "unions": gen_unions,
+    "nesting": gen_nesting,
+    "generics": gen_generics,
+    "enums": gen_enums,
+    "namespaces": gen_namespaces,
+    "references": gen_references,
+    "callbacks": gen_callbacks,
+}
+
+
+def generate_corpus(shape: str, size: int, depth: int = 4) -> str:
+    """
+    Returns a synthetic TypeScript source of the given ``shape``. ``size``
+    is the number of top-level items (or union members), ``depth`` the
+    nesting depth of anonymous object types. The shape "mixed" combines
+    all other shapes.
+    """
+    if shape == "mixed":
+        return "\n".join(gen(size, depth) for gen in SHAPES.values())
+    return SHAPES[shape](size, depth)
+
+
+class StageResult(NamedTuple):
+    stage: str
+    seconds: float
+    peak_memory: int  # bytes allocated on top of the stage's input
+
+
+def run_stages(source: str, trace_memory: bool = False) -> List[StageResult]:
+    """
+    Runs ``source`` through the ts2py-pipeline and measures the wall time
+    of every stage. With ``trace_memory`` the peak of the memory allocated
+    during every stage is measured, too, which slows the stages down.
+    """
+    results = []
+    stage_input: List = [source, "bench.ts"]
+
+    def run(stage: str, func: Callable):
+        nonlocal stage_input
+        start_memory = 0
+        if trace_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        stage_input = [func(*stage_input)]
+        seconds = time.perf_counter() - start
+        peak = 0
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] - start_memory
+        results.append(StageResult(stage, seconds, peak))
+
+    def parse(preprocessed):
+        _, source_text, source_mapping, _ = preprocessed
+        return parser.get_grammar()(source_text, source_mapping=source_mapping)
+
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        run("preprocessor", preprocessor.get_preprocessor())
+        run("parser", parse)
+        run("transformer", ast.get_transformer())
+        run("compiler", compiler.get_compiler())
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return results
+
+
+def same_tree(a: Node, b: Node) -> bool:
+    """Compares two syntax trees including the positions of their nodes."""
+    if a.name != b.name or a.pos != b.pos or len(a.children) != len(b.children):
+        return False
+    if not a.children:
+        return a.result == b.result
+    return all(same_tree(x, y) for x, y in zip(a.children, b.children))
+
+
+def check_fast_path(source: str) -> Optional[bool]:
+    """Returns None, if the fast path leaves ``source`` to the grammar, or
+    otherwise whether both yield the same concrete syntax tree."""
+    tree = fastpath.parse_subset(source)
+    if tree is None:
+        return None
+    reference = parser.get_grammar()(source)
+    return not reference.errors and same_tree(tree, reference)
+
+
+def measure_fast_path(source: str, repeat: int = 3) -> StageResult:
+    """Measures the best wall time of the fast path on ``source``, whether
+    it succeeds or falls back."""
+    best = float("inf")
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        fastpath.parse_subset(source)
+        best = min(best, time.perf_counter() - start)
+    return StageResult("parser (fast path)", best, 0)
+
+
+def measure_startup(repeat: int = 3) -> StageResult:
+    """Measures the best wall time of ``ts2py --help`` in a fresh interpreter,
+    i.e. the start-up of the command line interface."""
+    command = [sys.executable, "-m", "ts2py.main", "--help"]
+    best = float("inf")
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - start)
+    return StageResult("startup", best, 0)
+
+
+GRAMMAR_SETUP_SCRIPT = """
+import sys, time
+from DHParser import set_config_value
+from ts2py.syntax import parser
+set_config_value("ts2py.GrammarSnapshot", sys.argv[1] == "snapshot", allow_new_key=True)
+start = time.perf_counter()
+parser.get_grammar()
+print(time.perf_counter() - start)
+"""
+
+
+def measure_grammar_setup(from_snapshot: bool, repeat: int = 3) -> StageResult:
+    """
+    Measures the best time of instantiating the grammar in a fresh
+    interpreter, as in every new worker process, either from scratch or
+    from its snapshot. An additional first run creates the snapshot.
+    """
+    mode = "snapshot" if from_snapshot else "build"
+    command = [sys.executable, "-c", GRAMMAR_SETUP_SCRIPT, mode]
+    timings = []
+    for _ in range(max(repeat, 1) + 1):
+        output = subprocess.run(command, capture_output=True, text=True, check=True)
+        timings.append(float(output.stdout))
+    return StageResult(f"grammar ({mode})", min(timings[1:]), 0)
+
+
+PEAK_RSS_SCRIPT = """
+import sys, resource
+from DHParser import set_config_value
+from ts2py.api import compile_src
+set_config_value("ts2py.Memoization", sys.argv[2], allow_new_key=True)
+set_config_value("ts2py.MemoizationBound", int(sys.argv[3]), allow_new_key=True)
+with open(sys.argv[1], encoding="utf-8") as source_file:
+    compile_src(source_file.read())
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(peak if sys.platform == "darwin" else peak * 1024)
+"""
+
+
+def measure_peak_rss(source: str) -> StageResult:
+    """
+    Converts ``source`` in a fresh interpreter with the current memoization
+    policy and returns the wall time and the peak resident set size of that
+    process (Unix only).
+    """
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=".ts", encoding="utf-8", delete=False
+    ) as source_file:
+        source_file.write(source)
+    command = [
+        sys.executable,
+        "-c",
+        PEAK_RSS_SCRIPT,
+        source_file.name,
+        get_config_value("ts2py.Memoization", "on"),
+        str(get_config_value("ts2py.MemoizationBound", 512)),
+    ]
+    try:
+        start = time.perf_counter()
+        output = subprocess.run(command, capture_output=True, text=True, check=True)
+        seconds = time.perf_counter() - start
+    finally:
+        os.remove(source_file.name)
+    return StageResult("peak RSS", seconds, int(output.stdout))
+
+
+def measure_setup() -> StageResult:
+    """Measures the instantiation of the pipeline's thread-local singletons.
+    Only meaningful if they have not yet been used in the current thread."""
+    start = time.perf_counter()
+    preprocessor.get_preprocessor()
+    parser.get_grammar()
+    ast.get_transformer()
+    compiler.get_compiler()
+    return StageResult("setup", time.perf_counter() - start, 0)
+
+
+def benchmark(source: str, repeat: int = 3) -> List[StageResult]:
+    """
+    Returns the best wall time out of ``repeat`` runs and the peak memory
+    of one additional traced run for every stage of the pipeline.
+    """
+    timings = [run_stages(source) for _ in range(max(repeat, 1))]
+    traced = run_stages(source, trace_memory=True)
+    return [
+        StageResult(
+            stage.stage,
+            min(timing[i].seconds for timing in timings),
+            stage.peak_memory,
+        )
+        for i, stage in enumerate(traced)
+    ]
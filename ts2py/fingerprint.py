@@ -0,0 +1,77 @@
+"""The fingerprint of the tool that generates the code.
+
+Generated code can be reused as long as the grammar, the compiler, the
+version of ts2py and the presets that shape the generated code are the
+same. The hashes of the grammar and the compiler are computed only once
+per process and handed on to worker processes with ``share()``, so that
+taking a fingerprint does not read any files::
+
+    with ProcessPoolExecutor(initializer=share, initargs=(tool_hash(),)):
+        ...
+"""
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+from DHParser import get_config_values, md5
+from ts2py import __version__
+from ts2py.syntax import parser, compiler
+
+# presets that change how fast the code is generated, but not the code
+RUNTIME_PRESETS = frozenset(
+    [
+        "ts2py.GrammarSnapshot",
+        "ts2py.FastPath",
+        "ts2py.Memoization",
+        "ts2py.MemoizationBound",
+        "ts2py.ChunkSize",
+        "ts2py.ChunkJobs",
+        "ts2py.ResultCache",
+        "ts2py.ResultCacheSize",
+    ]
+)
+
+_tool_hash: Optional[str] = None
+_tool_hash_lock = threading.Lock()
+# the ts2py presets -> fingerprint
+_fingerprints: Dict[Tuple[Tuple[str, Any], ...], str] = {}
+
+
+def tool_hash() -> str:
+    """Returns a hash of the grammar, the compiler and the ts2py version,
+    which is computed on first use."""
+    global _tool_hash  # pylint: disable=global-statement
+    with _tool_hash_lock:
+        if _tool_hash is None:
+            _tool_hash = md5(
+                parser.TS2PyGrammar.source_hash__, compiler.script_hash(), __version__
+            )
+        return _tool_hash
+
+
+def share(hash_value: str) -> None:
+    """Adopts the tool hash of the parent process. Meant as initializer of
+    the executors of worker processes."""
+    global _tool_hash  # pylint: disable=global-statement
+    with _tool_hash_lock:
+        _tool_hash = hash_value
+
+
+def tool_fingerprint() -> str:
+    """
+    Returns the fingerprint of the tool hash and the active ts2py presets
+    (or thread-local configuration values) that shape the generated code.
+    Two conversions of the same source with the same fingerprint yield the
+    same result.
+    """
+    presets = tuple(
+        sorted(
+            (key, value)
+            for key, value in get_config_values("ts2py.*").items()
+            if key not in RUNTIME_PRESETS
+        )
+    )
+    fingerprint = _fingerprints.get(presets)
+    if fingerprint is None:
+        fingerprint = f"{tool_hash()} {md5(repr(presets))}"
+        _fingerprints[presets] = fingerprint
+    return fingerprint
@@ -20,78 +20,163 @@ permissions and limitations under the License.
 """
 
 import os
-from typing import List, Tuple, Optional, Any
+import json
+import time
+import warnings
+import importlib
+from typing import Any, List, Dict, Optional
 import typer
-from DHParser import (
-    compile_source,
-    set_config_value,
-    finalize_presets,
-    Error,
-    canonical_error_strings,
-    has_errors,
-    FATAL,
-    set_preset_value,
-    StringView,
-    read_local_config,
-    access_presets,
-)
-from ts2py.syntax import preprocessor, ast, parser, compiler
 from ts2py import __version__, types
 from ts2py.utils import helper
-from ts2py.utils.config import INI_FILE
 from ts2py.utils.logger import Logger
 
+# the programmatic entry points that have moved out of this module, so that
+# importing it for the command line does not load DHParser
+MOVED = {
+    "compile_src": "ts2py.api",
+    "serialize_result": "ts2py.api",
+    "process_file": "ts2py.batch",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in MOVED:
+        warnings.warn(
+            f"ts2py.main.{name} is deprecated, use {MOVED[name]}.{name} instead",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        return getattr(importlib.import_module(MOVED[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 app = typer.Typer(
     add_completion=False, context_settings={"help_option_names": ["-h", "--help"]}
 )
 
 
-def compile_src(source: str) -> Tuple[Any, List[Error]]:
-    """
-    Compiles ``source`` and returns (result, errors).
-    """
-    result_tuple = compile_source(
-        source,
-        preprocessor.get_preprocessor(),
-        parser.get_grammar(),
-        ast.get_transformer(),
-        compiler.get_compiler(),
-    )
-    return result_tuple[:2]  # drop the AST at the end of the result tuple
+def print_version(value: bool) -> None:
+    if value:
+        print(f"ts2py {__version__}")
+        raise typer.Exit()
 
 
-def serialize_result(result: Any) -> str:
+@app.callback()
+def cli(
+    _version: bool = typer.Option(
+        False,
+        "--version",
+        callback=print_version,
+        is_eager=True,
+        help="Show the version and exit",
+    ),
+):
     """
-    Serialize the result
+    ts2py - Python-Interoperability for Typescript-Interfaces
     """
-    if isinstance(result, (str, StringView)):
-        return str(result)
-    return repr(result)
 
 
-def process_file(source: str, target: str) -> None:
+@app.command()
+def convert(
+    path: str = typer.Argument(
+        ..., help="Define the path to the file or the folder to process"
+    ),
+    compatibility: types.args.PythonCompatibilityArg = typer.Option(
+        "3.11",
+        "--compatibility",
+        "-c",
+        help="Minimal required Python version (must be >= 3.6)",
+    ),
+    verbose: bool = typer.Option(
+        False, "--verbose", "-v", help="Enable verbose output"
+    ),
+    peps: List[types.args.PepArg] = typer.Option(
+        ["655"], "--pep", "-p", help="Assume Python-PEPs, e.g. 655"
+    ),
+    decorator: Optional[str] = typer.Option(
+        None, "--decorator", help="Add the given decorator"
+    ),
+    debug: bool = typer.Option(False, "--debug", "-d", help="Enable debug mode"),
+    fast_path: bool = typer.Option(
+        False,
+        "--fast-path",
+        help="Parse plain interfaces, types and enums without the PEG parser",
+    ),
+    jobs: int = typer.Option(
+        1, "--jobs", "-j", min=1, help="Number of files to convert in parallel"
+    ),
+    force: bool = typer.Option(
+        False, "--force", "-f", help="Convert files even if they are up to date"
+    ),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help="Write the generated code declaration by declaration to save memory",
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Print a JSON line with timings for every file to stderr",
+    ),
+    include: List[str] = typer.Option(
+        ["*.ts"], "--include", help="Glob pattern of files to convert in folders"
+    ),
+    exclude: List[str] = typer.Option(
+        [], "--exclude", help="Glob pattern of files or folders to skip"
+    ),
+    out_dir: Optional[str] = typer.Option(
+        None, "--out", "-o", help="Mirror the folder structure to this folder"
+    ),
+    memoization: Optional[types.args.MemoizationArg] = typer.Option(
+        None,
+        "--memoization",
+        help="Memoization policy of the parser (default: see ts2pyParser.ini)",
+    ),
+    chunk_size: Optional[int] = typer.Option(
+        None,
+        "--chunk-size",
+        min=0,
+        help="Parse files of more than twice this many characters in parallel "
+        "chunks (0: never)",
+    ),
+    cache_dir: Optional[str] = typer.Option(
+        None,
+        "--cache-dir",
+        envvar="TS2PY_RESULT_CACHE",
+        help="Reuse the results of earlier conversions stored in this folder",
+    ),
+):
     """
-    Compiles the source and writes the serialized results back to disk,
-    unless any fatal errors have occurred. Error and Warning messages are
-    returned in the terminal output.
+    Convert from TypeScript interface/type to Python TypedDict
     """
-    if os.path.isfile(target):
-        Logger().info(f"Target file '{target}' already exists, deleting it...")
-        os.remove(target)
-    result, errors = compile_src(source)
-    if not has_errors(errors, FATAL):
-        with open(target, "w", encoding="utf-8") as results_file:
-            results_file.write(serialize_result(result))
-    if errors:
-        Logger().error("\n".join(canonical_error_strings(errors)))
-    else:
-        Logger().success(f"Conversion for file '{source}' completed succesfully")
+    if not profile:
+        helper.banner(__version__)
+    helper.check_path(path)
+    helper.check_grammar_file()
+    Logger().set_verbose(verbose)
+    from ts2py import batch, fingerprint
+
+    batch.setup_presets(
+        compatibility,
+        peps,
+        decorator,
+        debug,
+        fast_path,
+        memoization,
+        chunk_size,
+        cache_dir,
+    )
+    directory, filenames = batch.collect_filenames(path, include, exclude)
+    helper.check_ts_extension(filenames)
+    manifest = batch.Manifest(out_dir or directory, fingerprint.tool_fingerprint())
+    work = batch.work_list(directory, filenames, out_dir)
+    batch.batch_process(work, jobs, manifest, force, stream, profile)
 
 
 @app.command()
-def convert(
+def watch(
     path: str = typer.Argument(
-        ..., help="Define the path to the file or the folder to process"
+        ..., help="Define the path to the file or the folder to watch"
     ),
     compatibility: types.args.PythonCompatibilityArg = typer.Option(
         "3.11",
@@ -109,60 +194,239 @@ def convert(
         None, "--decorator", help="Add the given decorator"
     ),
     debug: bool = typer.Option(False, "--debug", "-d", help="Enable debug mode"),
+    fast_path: bool = typer.Option(
+        False,
+        "--fast-path",
+        help="Parse plain interfaces, types and enums without the PEG parser",
+    ),
+    interval: float = typer.Option(
+        0.5, "--interval", "-i", min=0.01, help="Polling interval in seconds"
+    ),
+    include: List[str] = typer.Option(
+        ["*.ts"], "--include", help="Glob pattern of files to convert in folders"
+    ),
+    exclude: List[str] = typer.Option(
+        [], "--exclude", help="Glob pattern of files or folders to skip"
+    ),
 ):
     """
-    Convert from TypeScript interface/type to Python TypedDict
+    Convert TypeScript files whenever they change, until interrupted
     """
+    helper.banner(__version__)
     helper.check_path(path)
     helper.check_grammar_file()
-    read_local_config(INI_FILE)
-    access_presets()
+    Logger().set_verbose(verbose)
+    from ts2py import batch, fingerprint
+
+    batch.setup_presets(compatibility, peps, decorator, debug, fast_path)
+    # grammar, transformer and compiler stay warm for the whole session
+    directory, _ = batch.collect_filenames(path, include, exclude)
+    manifest = batch.Manifest(directory, fingerprint.tool_fingerprint())
+    mtimes: Dict[str, int] = {}
+    Logger().success(f"Watching '{path}' for changes, press Ctrl+C to stop")
+    try:
+        while True:
+            _, filenames = batch.collect_filenames(path, include, exclude)
+            filenames = [fn for fn in filenames if fn.lower().endswith(".ts")]
+            changed = []
+            existing: Dict[str, int] = {}
+            for filename in filenames:
+                try:
+                    existing[filename] = os.stat(filename).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                if mtimes.get(filename) != existing[filename]:
+                    changed.append(filename)
+            # deleted files are forgotten, so that they are converted again,
+            # if they are created anew
+            mtimes = existing
+            if changed:
+                try:
+                    batch.batch_process(
+                        batch.work_list(directory, changed),
+                        1,
+                        manifest,
+                        context=batch.work_list(directory, list(existing)),
+                    )
+                except OSError as err:
+                    # e.g. a file that has been deleted in the meantime; the
+                    # other changed files are converted in the next cycle
+                    Logger().error(f"Conversion failed: {err}")
+                    for filename in changed:
+                        del mtimes[filename]
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        Logger().success("Stopped watching")
+
+
+@app.command()
+def bench(
+    shapes: List[str] = typer.Option(
+        ["mixed"],
+        "--shape",
+        "-s",
+        help="Shape of the synthetic corpus: mixed, interfaces, unions, nesting, "
+        "generics, enums, namespaces, references or callbacks",
+    ),
+    size: int = typer.Option(
+        100, "--size", "-n", min=1, help="Number of top-level items per shape"
+    ),
+    depth: int = typer.Option(
+        4, "--depth", min=1, help="Nesting depth of anonymous object types"
+    ),
+    repeat: int = typer.Option(
+        3, "--repeat", "-r", min=1, help="Number of timed runs per corpus"
+    ),
+    as_json: bool = typer.Option(
+        False, "--json", help="Print one JSON object per line instead of a table"
+    ),
+    startup_budget: Optional[float] = typer.Option(
+        None,
+        "--startup-budget",
+        min=0,
+        help="Fail if 'ts2py --help' takes longer than this many seconds",
+    ),
+    memoization: Optional[types.args.MemoizationArg] = typer.Option(
+        None,
+        "--memoization",
+        help="Memoization policy of the parser (default: see ts2pyParser.ini)",
+    ),
+    rss: bool = typer.Option(
+        False, "--rss", help="Measure the peak RSS of every corpus in a fresh process"
+    ),
+):
+    """
+    Benchmark the conversion stages on synthetic TypeScript corpora
+    """
+    if not as_json:
+        helper.banner(__version__)
+    from ts2py import batch, bench as benchmarks
+
+    for shape in shapes:
+        if shape != "mixed" and shape not in benchmarks.SHAPES:
+            Logger().error(f"Unknown corpus shape '{shape}'")
+            raise typer.Exit(1)
+    helper.check_grammar_file()
+    batch.setup_presets(
+        types.args.PythonCompatibilityArg.PYTHON311,
+        [types.args.PepArg.PEP655],
+        None,
+        False,
+        memoization=memoization,
+    )
+    for stage in (
+        benchmarks.measure_startup(repeat),
+        benchmarks.measure_grammar_setup(False, repeat),
+        benchmarks.measure_grammar_setup(True, repeat),
+        benchmarks.measure_setup(),
+    ):
+        if as_json:
+            print(json.dumps({"stage": stage.stage, "seconds": stage.seconds}))
+        else:
+            print(f"{stage.stage:<28}{stage.seconds * 1000:>12.1f} ms")
+        if stage.stage == "startup" and startup_budget is not None:
+            if stage.seconds > startup_budget:
+                Logger().error(
+                    f"Start-up took {stage.seconds:.3f} s, "
+                    f"the budget is {startup_budget:.3f} s"
+                )
+                raise typer.Exit(1)
+    for shape in shapes:
+        source = benchmarks.generate_corpus(shape, size, depth)
+        results = benchmarks.benchmark(source, repeat)
+        equivalent = benchmarks.check_fast_path(source)
+        fast_path = benchmarks.measure_fast_path(source, repeat)
+        if as_json:
+            for stage in results:
+                record = {"shape": shape, "size": size, "depth": depth}
+                record.update(stage._asdict())
+                print(json.dumps(record))
+            record = {"shape": shape, "size": size, "depth": depth}
+            record.update(fast_path._asdict(), fallback=equivalent is None)
+            print(json.dumps(record))
+        else:
+            print(f"\n{shape} (size={size}, depth={depth}, {len(source)} characters)")
+            for stage in results:
+                print(
+                    f"  {stage.stage:<26}{stage.seconds * 1000:>12.1f} ms"
+                    f"{stage.peak_memory / 2**20:>12.2f} MiB"
+                )
+            total = sum(r.seconds for r in results)
+            print(f"  {'total':<26}{total * 1000:>12.1f} ms")
+            fallback = "   falls back on the grammar" if equivalent is None else ""
+            print(
+                f"  {fast_path.stage:<26}{fast_path.seconds * 1000:>12.1f} ms{fallback}"
+            )
+        if rss:
+            peak = benchmarks.measure_peak_rss(source)
+            if as_json:
+                record = {"shape": shape, "size": size, "depth": depth}
+                record.update(peak._asdict())
+                print(json.dumps(record))
+            else:
+                print(
+                    f"  {peak.stage:<26}{'':>15}{peak.peak_memory / 2**20:>12.2f} MiB"
+                )
+        if equivalent is False:
+            Logger().error(
+                f"The fast path yields a different syntax tree for '{shape}'"
+            )
+            raise typer.Exit(1)
+
 
-    # Set verbose
+@app.command()
+def serve(
+    socket_path: str = typer.Argument(
+        "ts2py.sock", help="Path of the Unix socket to listen on"
+    ),
+    compatibility: types.args.PythonCompatibilityArg = typer.Option(
+        "3.11",
+        "--compatibility",
+        "-c",
+        help="Minimal required Python version (must be >= 3.6)",
+    ),
+    verbose: bool = typer.Option(
+        False, "--verbose", "-v", help="Enable verbose output"
+    ),
+    peps: List[types.args.PepArg] = typer.Option(
+        ["655"], "--pep", "-p", help="Assume Python-PEPs, e.g. 655"
+    ),
+    decorator: Optional[str] = typer.Option(
+        None, "--decorator", help="Add the given decorator"
+    ),
+    workers: int = typer.Option(
+        4, "--workers", "-w", min=1, help="Number of conversion threads"
+    ),
+    fast_path: bool = typer.Option(
+        False,
+        "--fast-path",
+        help="Parse plain interfaces, types and enums without the PEG parser",
+    ),
+):
+    """
+    Answer JSON-RPC conversion requests on a Unix socket, until interrupted
+    """
+    helper.banner(__version__)
+    helper.check_grammar_file()
     Logger().set_verbose(verbose)
-    # Set PEPS
-    for pep in peps:
-        kwargs = {"value": True, "allow_new_key": True}
-        if pep == types.args.PepArg.PEP435:
-            set_preset_value("ts2py.UseEnum", **kwargs)
-        if pep == types.args.PepArg.PEP584:
-            set_preset_value("ts2py.UseLiteralType", **kwargs)
-        if pep == types.args.PepArg.PEP604:
-            set_preset_value("ts2py.TypeUnion", **kwargs)
-        if pep == types.args.PepArg.PEP655:
-            set_preset_value("ts2py.UseNotRequired", **kwargs)
-    # Set compatibility
-    if helper.use_type_union(compatibility):
-        set_preset_value("ts2py.UseTypeUnion", True, allow_new_key=True)
-    # Set decorator
-    if decorator:
-        set_preset_value("ts2py.ClassDecorator", decorator)
-    # Set debug mode
-    if debug:
-        set_preset_value("history_tracking", True)
-        set_preset_value("resume_notices", True)
-        set_preset_value(
-            "log_syntax_trees", frozenset(["cst", "ast"])
-        )  # don't use a set literal, here
-    finalize_presets()
-    set_config_value("batch_processing_parallelization", False)
-
-    if os.path.isdir(path):
-        filenames = [
-            os.path.join(path, fn)
-            for fn in os.listdir(path)
-            if os.path.isfile(os.path.join(path, fn))
-        ]
-    else:
-        filenames = [path]
+    from ts2py import batch
+    from ts2py.server import ConversionServer
 
-    helper.check_ts_extension(filenames)
-    for filename in filenames:
-        process_file(filename, f"{filename[:-3]}.py")
+    batch.setup_presets(compatibility, peps, decorator, False, fast_path)
+    try:
+        server = ConversionServer(socket_path, workers)
+    except FileExistsError as err:
+        Logger().error(str(err))
+        raise typer.Exit(1)
+    with server:
+        Logger().success(f"Listening on '{socket_path}', press Ctrl+C to stop")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            Logger().success("Server stopped")
 
 
 def main():
-    helper.banner(__version__)
     app()
 
 
@@ -0,0 +1,238 @@
+"""Imports between the TypeScript files of one conversion.
+
+The import statements and "/// <reference path>" directives of every file
+are resolved to the other files of the conversion. The files are compiled
+in topological order, so that the types a file imports are known when it
+is compiled, and every file is parsed only once, however many other files
+import it. The compiled files only pass on their top-level types
+(``compiler.ModuleSymbols``) to the files that import them.
+"""
+
+import os
+import keyword
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+from ts2py.syntax.compiler import ModuleImports, ModuleSymbols
+from ts2py.syntax.preprocessor import Import, find_imports
+from ts2py.utils.logger import Logger
+
+# suffixes tried when resolving an import like './a' to a file
+SUFFIXES = ("", ".ts", ".d.ts", os.sep + "index.ts", os.sep + "index.d.ts")
+
+
+def python_name(name: str) -> str:
+    """The name of a TypeScript identifier in the generated code."""
+    return name + "_" if keyword.iskeyword(name) else name
+
+
+def python_module(importer: str, dependency: str) -> Optional[str]:
+    """
+    Returns the relative module path for importing the generated file
+    ``dependency`` from the generated file ``importer``, e.g. '..lib.a', or
+    None, if the file name is not a valid module name, e.g. 'a.d.py'.
+    """
+    path = os.path.relpath(
+        os.path.splitext(os.path.abspath(dependency))[0],
+        os.path.dirname(os.path.abspath(importer)),
+    )
+    parts = path.split(os.sep)
+    dots = 1
+    while parts[0] == os.pardir:
+        dots += 1
+        parts.pop(0)
+    if not all(part.isidentifier() for part in parts):
+        return None
+    return "." * dots + ".".join(parts)
+
+
+class ModuleGraph:
+    """
+    The imports between the files of a list of (source, target)-pairs, as
+    passed to ``batch.batch_process()``. Only relative imports of files in
+    that list are resolved, imports of packages are ignored.
+    """
+
+    def __init__(self, work: List[Tuple[str, str]]):
+        self.targets: Dict[str, str] = dict(work)
+        self.files = {os.path.abspath(filename): filename for filename, _ in work}
+        # file -> list of (imported file, import)
+        self.imports: Dict[str, List[Tuple[str, Import]]] = {}
+        for filename, _ in work:
+            with open(filename, "r", encoding="utf-8") as source_file:
+                source = source_file.read()
+            resolved = []
+            for imp in find_imports(source):
+                dependency = self.resolve(filename, imp.specifier)
+                if dependency is None:
+                    Logger().info(
+                        f"Import '{imp.specifier}' in '{filename}' is not converted"
+                    )
+                elif dependency != filename:
+                    resolved.append((dependency, imp))
+            self.imports[filename] = resolved
+
+    def resolve(self, filename: str, specifier: str) -> Optional[str]:
+        """Returns the file that ``specifier`` refers to or None."""
+        if not specifier.startswith("."):
+            return None
+        base = os.path.normpath(
+            os.path.join(os.path.dirname(os.path.abspath(filename)), specifier)
+        )
+        bases = [base[:-3], base] if base.endswith(".js") else [base]
+        for candidate in bases:
+            for suffix in SUFFIXES:
+                dependency = self.files.get(candidate + suffix)
+                if dependency is not None:
+                    return dependency
+        return None
+
+    def dependencies(self, filename: str) -> List[str]:
+        """The files that ``filename`` imports."""
+        return list(dict.fromkeys(dep for dep, _ in self.imports.get(filename, ())))
+
+    def preceding_dependencies(self, filename: str, rank: Dict[str, int]) -> List[str]:
+        """The files that ``filename`` imports and that come before it in the
+        ``rank`` of the files, i.e. all but those on an import cycle."""
+        return [
+            dep for dep in self.dependencies(filename) if rank[dep] < rank[filename]
+        ]
+
+    def order(self, filenames: List[str]) -> List[str]:
+        """
+        Sorts ``filenames`` so that every file follows the files it imports
+        and keeps their order otherwise. Import cycles are broken at the
+        file of the cycle that comes first.
+        """
+        wanted = set(filenames)
+        visited = set()
+        order = []
+        for root in filenames:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack: List[Tuple[str, Iterator[str]]] = [
+                (root, iter(self.dependencies(root)))
+            ]
+            while stack:
+                filename, dependencies = stack[-1]
+                for dependency in dependencies:
+                    if dependency in wanted and dependency not in visited:
+                        visited.add(dependency)
+                        stack.append((dependency, iter(self.dependencies(dependency))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(filename)
+        return order
+
+    def module_imports(
+        self, filename: str, symbols: Dict[str, ModuleSymbols], rank: Dict[str, int]
+    ) -> ModuleImports:
+        """
+        Returns the types that ``filename`` imports and the import statements
+        for the generated code, given the ``symbols`` of the files that have
+        already been compiled and the ``rank`` of the files in the order of
+        ``order()``. Types of files that have not been compiled (yet) remain
+        unknown, and so do the types of files that follow ``filename``
+        because of an import cycle, even if their symbols are known from an
+        earlier conversion. They are referred to by forward references, so
+        that the generated modules do not import each other.
+        """
+        lines = []
+        types = set()
+        typed_dicts = set()
+        for dependency, imp in self.imports.get(filename, ()):
+            if rank[dependency] > rank[filename]:  # on an import cycle
+                continue
+            exported = symbols.get(dependency)
+            module = python_module(self.targets[filename], self.targets[dependency])
+            if exported is None or module is None:
+                continue
+            if imp.namespace:
+                i = module.rfind(".")
+                package = module[:i] if module[:i].strip(".") else module[: i + 1]
+                namespace = python_name(imp.namespace)
+                lines.append(f"from {package} import {module[i + 1:]} as {namespace}")
+                for name in exported.types:
+                    types.add(f"{namespace}.{name}")
+                    if name in exported.typed_dicts:
+                        typed_dicts.add(f"{namespace}.{name}")
+                continue
+            if imp.everything:
+                names = [(name, name) for name in sorted(exported.types)]
+            else:
+                names = [
+                    (python_name(name), python_name(local))
+                    for name, local in imp.names
+                    if python_name(name) in exported.types
+                ]
+            if names:
+                lines.append(
+                    f"from {module} import "
+                    + ", ".join(
+                        name if name == local else f"{name} as {local}"
+                        for name, local in names
+                    )
+                )
+                types.update(local for _, local in names)
+                typed_dicts.update(
+                    local for name, local in names if name in exported.typed_dicts
+                )
+        return ModuleImports(
+            "\n".join(lines), ModuleSymbols(frozenset(types), frozenset(typed_dicts))
+        )
+
+    def exports(
+        self,
+        filename: str,
+        declared: ModuleSymbols,
+        symbols: Dict[str, ModuleSymbols],
+        rank: Dict[str, int],
+    ) -> ModuleSymbols:
+        """Adds the types that ``filename`` re-exports ("export ... from") to
+        the types ``declared`` in it, cf. ``module_imports()``."""
+        types = set(declared.types)
+        typed_dicts = set(declared.typed_dicts)
+        for dependency, imp in self.imports.get(filename, ()):
+            if rank[dependency] > rank[filename]:  # on an import cycle
+                continue
+            exported = symbols.get(dependency)
+            module = python_module(self.targets[filename], self.targets[dependency])
+            if not imp.reexport or imp.namespace or exported is None or module is None:
+                continue
+            if imp.everything:
+                types.update(exported.types)
+                typed_dicts.update(exported.typed_dicts)
+            for name, local in imp.names:
+                if python_name(name) in exported.types:
+                    types.add(python_name(local))
+                    if python_name(name) in exported.typed_dicts:
+                        typed_dicts.add(python_name(local))
+        return ModuleSymbols(frozenset(types), frozenset(typed_dicts))
+
+    def uses(
+        self, filename: str, references: FrozenSet[str], rank: Dict[str, int]
+    ) -> Dict[str, List[str]]:
+        """
+        Returns the names of the types that ``filename`` takes from each of
+        the files it imports, given the names of the types it ``references``.
+        "*" stands for all types of a file. A change of any of these types
+        in the imported file affects the code generated for ``filename``.
+        Files that follow ``filename`` on an import cycle are left out, cf.
+        ``module_imports()``.
+        """
+        uses: Dict[str, Set[str]] = {
+            dep: set() for dep in self.preceding_dependencies(filename, rank)
+        }
+        for dependency, imp in self.imports.get(filename, ()):
+            if dependency not in uses:
+                continue
+            if imp.everything:
+                uses[dependency].add("*")
+            elif imp.namespace:
+                prefix = python_name(imp.namespace) + "."
+                for name in references:
+                    if name.startswith(prefix):
+                        uses[dependency].add(name[len(prefix) :])
+            else:
+                uses[dependency].update(python_name(name) for name, _ in imp.names)
+        return {dependency: sorted(names) for dependency, names in uses.items()}
@@ -0,0 +1,80 @@
+"""Per-file profiling of the ts2py-pipeline: wall time of the stages,
+node counts of the syntax trees and the time spent in the compiler's
+``on_*``-handlers.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional
+from DHParser import Node
+
+
+def count_nodes(tree: Any) -> int:
+    if not isinstance(tree, Node):
+        return 0
+    return sum(1 for _ in tree.select_if(lambda _node: True, include_root=True))
+
+
+class TimedStage:
+    """Wraps a stage of the pipeline, so that its wall time (and optionally
+    the node count of the tree it returns) is recorded in a Profile. Other
+    attributes are looked up on the wrapped stage, because DHParser's
+    ``compile_source()`` inspects some of them."""
+
+    def __init__(
+        self, profile: "Profile", stage: str, func: Callable, tree_name: str = ""
+    ):
+        self.profile = profile
+        self.stage = stage
+        self.func = func
+        self.tree_name = tree_name
+
+    def __call__(self, *args, **kwargs) -> Any:
+        start = time.perf_counter()
+        result = self.func(*args, **kwargs)
+        self.profile.stages[self.stage] = time.perf_counter() - start
+        if self.tree_name:
+            self.profile.node_counts[self.tree_name] = count_nodes(result)
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.func, name)
+
+
+class TimedCompiler(TimedStage):
+    """Additionally lets the compiler record the time of its handlers."""
+
+    def __init__(self, profile: "Profile", func: Callable, ts2py_compiler: Any):
+        super().__init__(profile, "compiler", func)
+        self.ts2py_compiler = ts2py_compiler
+
+    def __call__(self, *args, **kwargs) -> Any:
+        self.ts2py_compiler.handler_times = self.profile.handler_times
+        try:
+            return super().__call__(*args, **kwargs)
+        finally:
+            self.ts2py_compiler.handler_times = None
+
+
+class Profile:
+    """Profile of the conversion of a single source."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.stages: Dict[str, float] = {}
+        self.node_counts: Dict[str, int] = {}
+        # node name -> [number of calls, time spent excluding child nodes]
+        self.handler_times: Dict[str, List[Any]] = {}
+
+    def as_dict(self, slowest: Optional[int] = 10) -> Dict[str, Any]:
+        handlers = sorted(
+            self.handler_times.items(), key=lambda item: item[1][1], reverse=True
+        )
+        return {
+            "file": self.source,
+            "stages": self.stages,
+            "nodes": self.node_counts,
+            "handlers": [
+                {"handler": f"on_{name}", "calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in handlers[:slowest]
+            ],
+        }
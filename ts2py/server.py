@@ -0,0 +1,159 @@
+"""A long-running conversion server that answers JSON-RPC requests on a
+local Unix socket, so that the conversion of a single source does not pay
+for the start-up of ts2py. Requests and responses are JSON objects, one
+per line, e.g.::
+
+    {"jsonrpc": "2.0", "id": 1, "method": "convert",
+     "params": {"source": "interface A { a: string; }",
+                "options": {"UseTypeUnion": true}}}
+
+    {"jsonrpc": "2.0", "id": 1,
+     "result": {"python": "from typing import TypedDict ...", "errors": []}}
+"""
+
+import os
+import json
+import stat
+import socket
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+from DHParser import (
+    canonical_error_strings,
+    get_config_values,
+    has_errors,
+    set_config_value,
+    FATAL,
+)
+from ts2py import __version__
+from ts2py.api import compile_src, serialize_result
+from ts2py.syntax import preprocessor, ast, parser, compiler
+from ts2py.utils.logger import Logger
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class RequestError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def warm_up() -> None:
+    """Instantiates the thread-local singletons of a worker thread."""
+    preprocessor.get_preprocessor()
+    parser.get_grammar()
+    ast.get_transformer()
+    compiler.get_compiler()
+
+
+def convert(source: str, options: Dict[str, Any], presets: Dict[str, Any]) -> Dict:
+    """
+    Converts ``source`` with the given ``options`` (ts2py preset names
+    without the "ts2py."-prefix) in the current worker thread. Since the
+    configuration is thread-local, the presets are restored first.
+    """
+    for key, value in presets.items():
+        set_config_value(key, value)
+    for key, value in options.items():
+        set_config_value(f"ts2py.{key}", value)
+    if source.find("\n") < 0:
+        source += "\n"  # never let DHParser mistake the source for a file name
+    result, errors = compile_src(source)
+    return {
+        "python": None if has_errors(errors, FATAL) else serialize_result(result),
+        "errors": canonical_error_strings(errors),
+    }
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                response = self.server.dispatch(line)
+                self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+
+def remove_stale_socket(socket_path: str) -> None:
+    """
+    Removes the socket left over by a server that is no longer running.
+    Raises a FileExistsError, if ``socket_path`` is anything else, e.g. a
+    regular file or the socket of a server that is still running.
+    """
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"'{socket_path}' exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            os.remove(socket_path)
+            return
+    raise FileExistsError(f"A server is already listening on '{socket_path}'")
+
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Reads requests from any number of connections and runs the conversions
+    on a fixed pool of worker threads, each of which keeps its grammar,
+    transformer and compiler for the whole lifetime of the server.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, workers: int):
+        remove_stale_socket(socket_path)
+        self.presets = get_config_values("ts2py.*")
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="ts2py", initializer=warm_up
+        )
+        super().__init__(socket_path, RequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+    def dispatch(self, line: bytes) -> Dict:
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as err:
+                raise RequestError(PARSE_ERROR, f"Parse error: {err}") from err
+            if not isinstance(request, dict) or "method" not in request:
+                raise RequestError(INVALID_REQUEST, "Invalid request")
+            request_id = request.get("id")
+            result = self.call(request["method"], request.get("params", {}))
+            return {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except RequestError as err:
+            error = {"code": err.code, "message": str(err)}
+        except Exception as err:  # pylint: disable=broad-except
+            error = {"code": INTERNAL_ERROR, "message": repr(err)}
+        return {"jsonrpc": "2.0", "id": request_id, "error": error}
+
+    def call(self, method: str, params: Any) -> Any:
+        if method == "version":
+            return __version__
+        if method != "convert":
+            raise RequestError(METHOD_NOT_FOUND, f"Method '{method}' not found")
+        if not isinstance(params, dict) or not isinstance(params.get("source"), str):
+            raise RequestError(INVALID_PARAMS, "Parameter 'source' is missing")
+        options = params.get("options", {})
+        if not isinstance(options, dict):
+            raise RequestError(INVALID_PARAMS, "Parameter 'options' must be an object")
+        unknown = [key for key in options if f"ts2py.{key}" not in self.presets]
+        if unknown:
+            raise RequestError(INVALID_PARAMS, f"Unknown options: {unknown}")
+        Logger().info(f"Converting {len(params['source'])} characters")
+        future = self.executor.submit(convert, params["source"], options, self.presets)
+        return future.result()
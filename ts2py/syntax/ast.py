@@ -4,7 +4,7 @@ from DHParser import (
     change_name,
     ThreadLocalSingletonFactory,
 )
-from ts2py import types
+from ts2py.types import dhparser
 
 ts2py_AST_transformation_table = {
     # AST Transformations for the ts2py-grammar
@@ -14,7 +14,7 @@ ts2py_AST_transformation_table = {
 }
 
 
-def ts2py_transformer() -> types.dhparser.TransformerCallable:
+def ts2py_transformer() -> dhparser.TransformerCallable:
     """Creates a transformation function that does not share state with other
     threads or processes."""
     return partial(traverse, transformation_table=ts2py_AST_transformation_table.copy())
@@ -0,0 +1,203 @@
+"""Parallel parsing of large files in chunks of top-level declarations.
+
+``split_chunks()`` pre-scans a document for places where one top-level
+declaration ends with "}" or ";" and the next one starts at the beginning
+of a line with a keyword like ``export`` or ``interface``, skipping
+comments and strings and keeping track of the nesting of brackets. The
+chunks between these places are parsed in worker processes, and their
+syntax trees are merged into the syntax tree of the whole document, which
+is then transformed and compiled as a whole, so that all information about
+the declared types is available to the compiler in source order. If any
+chunk has errors, the whole document is parsed again in one piece to get
+the same error messages and error recovery as without chunking.
+"""
+
+import os
+import re
+import threading
+import concurrent.futures
+from typing import Any, Dict, List, Optional, Tuple, Union
+from DHParser import Node, RootNode, get_config_value, set_config_value
+from DHParser.toolkit import instantiate_executor
+from ts2py.syntax import parser, fastpath
+
+RX_SCAN = re.compile(
+    r"(?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))"
+    r"|(?P<string>\"[^\"\n]*\"?|'[^'\n]*'?|`[^`]*`?)"
+    r"|(?P<open>[{\[(])|(?P<close>[}\])])|(?P<semicolon>;)"
+    r"|(?P<keyword>^(?:export|interface|class|type|enum|declare|namespace|module"
+    r"|const|function)\b)",
+    re.DOTALL | re.MULTILINE,
+)
+
+# configuration values (and their defaults) that are passed on to the workers
+CHUNK_CONFIG = {
+    "ts2py.FastPath": False,
+    "ts2py.Memoization": "on",
+    "ts2py.MemoizationBound": 512,
+}
+
+# preorder list of (name, position, content or number of children)
+FlatTree = List[Tuple[str, int, Union[str, int]]]
+
+_executor: Optional[concurrent.futures.Executor] = None
+_executor_lock = threading.Lock()
+
+
+def split_points(document: str) -> List[int]:
+    """Returns the positions at which a top-level declaration starts right
+    after the previous one has been terminated."""
+    points = []
+    depth = 0
+    terminated = False  # previous token is a "}" or ";" on the top level
+    end = 0
+    for match in RX_SCAN.finditer(document):
+        kind = match.lastgroup
+        if kind == "comment":
+            gap = document[end : match.start()]
+            end = match.end()
+            if gap and not gap.isspace():
+                terminated = False
+            continue
+        gap = document[end : match.start()]
+        if gap and not gap.isspace():
+            terminated = False
+        end = match.end()
+        if kind == "open":
+            depth += 1
+            terminated = False
+        elif kind == "close":
+            depth -= 1
+            terminated = depth == 0
+        elif kind == "semicolon":
+            terminated = depth == 0
+        elif kind == "keyword":
+            if terminated and depth == 0:
+                points.append(match.start())
+            terminated = False
+        else:
+            terminated = False
+    return points
+
+
+def split_chunks(document: str, chunk_size: int) -> List[Tuple[int, str]]:
+    """Splits ``document`` into (offset, text)-chunks of top-level
+    declarations with at least ``chunk_size`` characters each."""
+    chunks = []
+    start = 0
+    for point in split_points(document):
+        if point - start >= chunk_size and len(document) - point >= chunk_size:
+            chunks.append((start, document[start:point]))
+            start = point
+    chunks.append((start, document[start:]))
+    return chunks
+
+
+def flatten(node: Node, flat_tree: FlatTree) -> None:
+    if node.children:
+        flat_tree.append((node.name, node.pos, len(node.children)))
+        for child in node.children:
+            flatten(child, flat_tree)
+    else:
+        flat_tree.append((node.name, node.pos, node.result))
+
+
+def rebuild(flat_tree: FlatTree, offset: int) -> List[Node]:
+    """Rebuilds the nodes of a flat tree, moving them by ``offset``."""
+    items = iter(flat_tree)
+
+    def build() -> Node:
+        name, pos, result = next(items)
+        if isinstance(result, int):
+            node = Node(name, tuple(build() for _ in range(result)))
+        else:
+            node = Node(name, result)
+        node._pos = pos + offset  # pylint: disable=protected-access
+        return node
+
+    _, _, result = next(items)  # the "document"-node of the chunk
+    if not isinstance(result, int):
+        return [Node("document", result)] if result else []
+    return [build() for _ in range(result)]
+
+
+def parse_chunk(text: str, config: Dict[str, Any]) -> Optional[FlatTree]:
+    """Parses a chunk in a worker process. Returns its flattened syntax tree
+    or None, if the chunk contains errors."""
+    for key, value in config.items():
+        set_config_value(key, value, allow_new_key=True)
+    parse = parser.get_grammar()
+    if get_config_value("ts2py.FastPath", False):
+        parse = fastpath.FastPathParser(parse)
+    root = parse(text)
+    if root.errors:
+        return None
+    flat_tree: FlatTree = []
+    flatten(root, flat_tree)
+    return flat_tree
+
+
+def get_executor() -> concurrent.futures.Executor:
+    """The process pool for parsing chunks, which is started on first use
+    with "ts2py.ChunkJobs" workers (one per CPU, if 0)."""
+    global _executor  # pylint: disable=global-statement
+    with _executor_lock:
+        if _executor is None:
+            _executor = instantiate_executor(
+                True,
+                concurrent.futures.ProcessPoolExecutor,
+                max_workers=get_config_value("ts2py.ChunkJobs", 0) or None,
+            )
+        return _executor
+
+
+class ChunkedParser:
+    """
+    Drop-in replacement for the parsing stage of ``compile_source()`` that
+    parses documents larger than ``chunk_size`` characters in chunks in
+    parallel, like ``FastPathParser``. ``grammar`` may be a grammar or a
+    ``FastPathParser`` and parses all other documents.
+    """
+
+    def __init__(self, grammar: Any, chunk_size: int):
+        self.grammar = grammar
+        self.chunk_size = chunk_size
+
+    def __call__(self, document: str, source_mapping: Any = None) -> RootNode:
+        grammar = self.grammar
+        if not (grammar.history_tracking__ or grammar.resume_notices__):
+            tree = self.parse_chunks(document)
+            if tree is not None:
+                root = RootNode().swallow(tree, document, source_mapping)
+                root.stage = "cst"
+                return root
+        return grammar(document, source_mapping=source_mapping)
+
+    def parse_chunks(self, document: str) -> Optional[Node]:
+        workers = get_config_value("ts2py.ChunkJobs", 0) or os.cpu_count() or 1
+        # about four chunks per worker to balance the load
+        chunk_size = max(self.chunk_size, len(document) // (4 * workers) + 1)
+        chunks = split_chunks(document, chunk_size)
+        if len(chunks) < 2:
+            return None
+        config = {
+            key: get_config_value(key, default) for key, default in CHUNK_CONFIG.items()
+        }
+        executor = get_executor()
+        futures = [executor.submit(parse_chunk, text, config) for _, text in chunks]
+        children: List[Node] = []
+        try:
+            for (offset, _), future in zip(chunks, futures):
+                flat_tree = future.result()
+                if flat_tree is None:
+                    return None
+                children.extend(rebuild(flat_tree, offset))
+        finally:
+            for future in futures:
+                future.cancel()
+        document_node = Node("document", tuple(children) or "")
+        document_node._pos = 0  # pylint: disable=protected-access
+        return document_node
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.grammar, name)
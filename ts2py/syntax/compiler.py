@@ -1,26 +1,37 @@
 import keyword
-from functools import lru_cache
 import re
-from typing import Tuple, List, Any, Set, Dict, Sequence, cast
+import time
+from typing import Tuple, List, Any, Set, Dict, Optional, Sequence, Callable, cast
+from typing import FrozenSet, Iterable, NamedTuple, Union
 from DHParser import (
     Compiler,
     Node,
     get_config_value,
     ErrorCode,
     ThreadLocalSingletonFactory,
-    pick_from_path,
     md5,
     as_list,
 )
+from DHParser.compile import ROOTNODE_PLACEHOLDER
+
+
+_script_hash: Optional[str] = None
+
+
+def script_hash() -> str:
+    """Returns the hash of this module, which is read only once."""
+    global _script_hash  # pylint: disable=global-statement
+    if _script_hash is None:
+        try:
+            with open(__file__, "r", encoding="utf-8") as current_file:
+                _script_hash = md5(current_file.read())
+        except (FileNotFoundError, IOError):
+            _script_hash = "source of ts2pyParser.py not found!?"
+    return _script_hash
+
 
-# TODO: check source hash
 def source_hash(source_text: str) -> str:
-    try:
-        with open(__file__, "r", encoding="utf-8") as current_file:
-            script_hash = md5(current_file.read())
-    except (FileNotFoundError, IOError):
-        script_hash = "source of ts2pyParser.py not found!?"
-    return " ".join([md5(source_text), script_hash])
+    return " ".join([md5(source_text), script_hash()])
 
 
 TYPING_TYPES = [
@@ -39,17 +50,113 @@ TYPING_TYPES = [
 ]
 
 
-def get_typing_imports(python_code: Any):
+def get_typing_imports(typing_names: Set[str]):
     initial_import_line = "from typing import"
     typing_types_to_add = ["TypedDict"]
     for typing_type in TYPING_TYPES:
-        typing_match = re.search(rf"\b({typing_type})\b", python_code)
-        if typing_match:
+        if typing_type in typing_names:
             typing_types_to_add.append(typing_type)
     typing_types_str = ", ".join(typing_types_to_add)
     return f"{initial_import_line} {typing_types_str}"
 
 
+# trailing blanks are removed and runs of more than two empty lines are
+# reduced to two empty lines in one go. A match may only start at the first
+# blank of a run of blanks, otherwise the regular expression is tried again
+# at every blank of the indentation of every line.
+RX_SUPERFLUOUS_WHITESPACE = re.compile(r"(?<! )(?:(?: *\n){3,}| +(?=\n))")
+
+
+def normalize_whitespace(python_code: str) -> str:
+    return RX_SUPERFLUOUS_WHITESPACE.sub(
+        lambda match: "\n\n\n" if match.group(0)[-1:] == "\n" else "", python_code
+    )
+
+
+class WhitespaceNormalizer:
+    """Applies ``normalize_whitespace()`` to a stream of code fragments and
+    passes the result on to ``write``. The trailing whitespace of a fragment
+    is held back, because it might continue in the next fragment."""
+
+    def __init__(self, write: Callable[[str], Any]):
+        self.write = write
+        self.pending = ""
+
+    def __call__(self, fragment: str) -> None:
+        code = self.pending + fragment
+        stripped = code.rstrip(" \n")
+        self.pending = code[len(stripped) :]
+        if stripped:
+            self.write(normalize_whitespace(stripped))
+
+    def flush(self) -> None:
+        if self.pending:
+            self.write(normalize_whitespace(self.pending))
+            self.pending = ""
+
+
+class CodeBlock:
+    """
+    Lines of code that are rendered as a whole, once the code of a top-level
+    declaration is complete. Nested blocks are indented by ``indent`` levels
+    relative to the enclosing block, so that the code of a nested class is
+    not re-indented and copied again at every level of nesting.
+    """
+
+    __slots__ = ("lines", "indent", "name")
+
+    def __init__(
+        self,
+        lines: Iterable[Union[str, "CodeBlock"]] = (),
+        indent: int = 0,
+        name: str = "",
+    ):
+        # strings of one or more lines and nested blocks
+        self.lines: List[Union[str, CodeBlock]] = list(lines)
+        self.indent = indent
+        self.name = name  # the name of the class, if the block defines one
+
+    def render(self, indentation: str, rendered: List[str]) -> None:
+        indentation += "    " * self.indent
+        if not self.lines:
+            rendered.append(indentation)
+        for line in self.lines:
+            if isinstance(line, CodeBlock):
+                line.render(indentation, rendered)
+            elif indentation:
+                rendered.append(indentation + line.replace("\n", "\n" + indentation))
+            else:
+                rendered.append(line)
+
+    def lstrip(self, chars: Optional[str] = None) -> "CodeBlock":
+        """Strips ``chars`` from the beginning of the first line."""
+        if self.lines and isinstance(self.lines[0], str):
+            lines = [self.lines[0].lstrip(chars)] + self.lines[1:]
+            return CodeBlock(lines, self.indent, self.name)
+        return self
+
+    def __str__(self) -> str:
+        rendered: List[str] = []
+        self.render("", rendered)
+        return "\n".join(rendered)
+
+
+RX_QUOTED_OR_NAME = re.compile(r"'[^']*(?:'|$)|\w+(?:\.\w+)*")
+
+
+def quote_forward_references(type_expression: str, names: Set[str]) -> str:
+    """Quotes all occurrences of ``names`` in ``type_expression`` that are
+    not already quoted in a single pass over the expression."""
+    if not names:
+        return type_expression
+
+    def quote(match) -> str:
+        token = match.group(0)
+        return f"'{token}'" if token in names else token
+
+    return RX_QUOTED_OR_NAME.sub(quote, type_expression)
+
+
 def to_typename(varname: str) -> str:
     # assert varname[-1:] != '_' or keyword.iskeyword(varname[:-1]), varname  # and varname[0].islower()
     return varname[0].upper() + varname[1:] + "_"
@@ -88,45 +195,135 @@ TYPE_NAME_SUBSTITUTION = {
 }
 
 
+# names that are known before anything has been compiled
+PREDEFINED_TYPES = frozenset(
+    [
+        "Union",
+        "List",
+        "Tuple",
+        "Optional",
+        "Dict",
+        "Any",
+        "Generic",
+        "Coroutine",
+        "list",
+    ]
+)
+
+
+class SymbolTable:
+    """
+    The names of the known types in nested scopes. Every name is mapped to
+    the depth of the innermost scope that declares it, so that looking up a
+    name and opening a scope take constant time. Closing a scope takes time
+    proportional to the number of names declared in it.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.depths: Dict[str, int] = {name: 0 for name in names}
+        # for every scope: name -> depth of the name outside the scope or -1
+        self.shadowed: List[Dict[str, int]] = [{}]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.depths
+
+    def push(self) -> None:
+        self.shadowed.append({})
+
+    def pop(self) -> None:
+        for name, depth in self.shadowed.pop().items():
+            if depth < 0:
+                del self.depths[name]
+            else:
+                self.depths[name] = depth
+
+    def add(self, name: str) -> None:
+        """Declares ``name`` in the innermost scope."""
+        depth = len(self.shadowed) - 1
+        outer = self.depths.get(name, -1)
+        if outer != depth:
+            self.shadowed[-1][name] = outer
+            self.depths[name] = depth
+
+    def update(self, names: Iterable[str]) -> None:
+        for name in names:
+            self.add(name)
+
+    def toplevel(self) -> Set[str]:
+        """The names declared in the outermost scope."""
+        return {name for name, depth in self.depths.items() if depth == 0}
+
+
+# nodes that are tracked by the ContextStack
+CONTEXT_NODES = frozenset(["interface", "function", "func_type"])
+
+
+class ContextStack:
+    """
+    The interfaces, functions and function types that enclose the node
+    being compiled. Other than searching ``Compiler.path``, looking up the
+    innermost enclosing node of a kind takes constant time.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        # node name -> (depth, node) for all enclosing nodes of that name
+        self.nodes: Dict[str, List[Tuple[int, Node]]] = {
+            name: [] for name in CONTEXT_NODES
+        }
+
+    def push(self, node: Node) -> None:
+        self.depth += 1
+        self.nodes[node.name].append((self.depth, node))
+
+    def pop(self, node: Node) -> None:
+        self.nodes[node.name].pop()
+        self.depth -= 1
+
+    def innermost(self, *names: str) -> Optional[Node]:
+        """Returns the innermost enclosing node with one of the given names."""
+        depth, innermost = 0, None
+        for name in names:
+            entries = self.nodes[name]
+            if entries and entries[-1][0] > depth:
+                depth, innermost = entries[-1]
+        return innermost
+
+
+class ModuleSymbols(NamedTuple):
+    """The top-level types of a compiled module, the TypedDicts among them
+    and the names of the types it refers to without declaring them."""
+
+    types: FrozenSet[str] = frozenset()
+    typed_dicts: FrozenSet[str] = frozenset()
+    references: FrozenSet[str] = frozenset()
+
+
+class ModuleImports(NamedTuple):
+    """The types imported from other modules (under their local names) and
+    the Python import statements for them."""
+
+    code: str = ""
+    symbols: ModuleSymbols = ModuleSymbols()
+
+
 class TS2PyCompiler(Compiler):
     """Compiler for the abstract-syntax-tree of a ts2py source file."""
 
+    sink: Optional[WhitespaceNormalizer] = None  # only set by stream()
+    # node name -> [calls, seconds excluding child nodes], set for profiling
+    handler_times: Optional[Dict[str, List[Any]]] = None
+    # types imported from other modules, set by the caller for one call
+    imports: Optional[ModuleImports] = None
+
     def reset(self):
         super().reset()
-        bcn = get_config_value("ts2py.BaseClassName", "TypedDict")
-        i = bcn.rfind(".")
-        if i >= 0:
-            self.additional_imports = f"\nfrom {bcn[:i]} import {bcn[i + 1:]}\n"
-            bcn = bcn[i + 1 :]
-        else:
-            self.additional_imports = ""
-        self.base_class_name = bcn
-        self.class_decorator = get_config_value("ts2py.ClassDecorator", "").strip()
-        if self.class_decorator:
-            if self.class_decorator[0] != "@":
-                self.class_decorator = "@" + self.class_decorator
-            self.class_decorator += "\n"
-        self.use_enums = get_config_value("ts2py.UseEnum", True)
-        self.use_type_union = get_config_value("ts2py.UseTypeUnion", False)
-        self.use_literal_type = get_config_value("ts2py.UseLiteralType", True)
-        self.use_not_required = get_config_value("ts2py.UseNotRequired", False)
-
         self.overloaded_type_names: Set[str] = set()
-        self.known_types: List[Set[str]] = [
-            {
-                "Union",
-                "List",
-                "Tuple",
-                "Optional",
-                "Dict",
-                "Any",
-                "Generic",
-                "Coroutine",
-                "list",
-            }
-        ]
-        self.local_classes: List[List[str]] = [[]]
-        self.base_classes: Dict[str, List[str]] = {}
+        self.known_types = SymbolTable(PREDEFINED_TYPES)
+        self.local_classes: List[List[CodeBlock]] = [[]]
+        self.base_classes: Dict[str, List[str]] = {}  # class -> its base classes
+        # id of an extends node -> the base classes it names
+        self.resolved_bases: Dict[int, List[str]] = {}
         self.typed_dicts: Set[str] = {
             "TypedDict"
         }  # names of classes that are TypedDicts
@@ -137,25 +334,68 @@ class TS2PyCompiler(Compiler):
         self.scope_type: List[str] = [""]
         self.optional_keys: List[List[str]] = [[]]
         self.func_name: str = ""  # name of the current functions header or ''
+        self.context = ContextStack()
         self.strip_type_from_const = False
-
-    def compile(self, node) -> str:
-        result = super().compile(node)
-        if isinstance(result, str):
+        self.typing_names: Set[str] = set()  # names from typing in the output
+        self.imported: ModuleSymbols = ModuleSymbols()
+        self.referenced_types: Set[str] = set()  # contents of type_name nodes
+        # id of a node -> contents of the type_name nodes below it
+        self.type_names_below: Dict[int, FrozenSet[str]] = {}
+        self.child_times: List[float] = []
+
+    def compile(self, node) -> Any:
+        tracked = node.name in CONTEXT_NODES
+        if tracked:
+            self.context.push(node)
+        if self.handler_times is None:
+            result = super().compile(node)
+        else:
+            result = self.timed_compile(node)
+        if tracked:
+            self.context.pop(node)
+        if isinstance(result, (str, CodeBlock)):
             return result
         raise TypeError(
             f"Compilation of {node.name} yielded a result of "
-            f"type {str(type(result))} and not str as expected!"
+            f"type {str(type(result))} and not str or CodeBlock as expected!"
         )
 
+    def timed_compile(self, node) -> Any:
+        start = time.perf_counter()
+        self.child_times.append(0.0)
+        try:
+            return super().compile(node)
+        finally:
+            elapsed = time.perf_counter() - start
+            own_time = elapsed - self.child_times.pop()
+            if self.child_times:
+                self.child_times[-1] += elapsed
+            name = node.name[1:] + "__" if node.name[:1] == ":" else node.name
+            stats = self.handler_times.setdefault(name, [0, 0.0])
+            stats[0] += 1
+            stats[1] += own_time
+
     def is_toplevel(self) -> bool:
         return self.obj_name == ["TOPLEVEL_"]
 
+    def add_typing_names(self, python_type: str) -> None:
+        """Records the typing name a (substituted) python type starts with."""
+        name = python_type.split("[", 1)[0]
+        if name in TYPING_TYPES:
+            self.typing_names.add(name)
+
+    def keep_typing_names(self, names: Set[str], classes: List[CodeBlock]) -> None:
+        """Records those typing ``names`` of code that is left out of the
+        output, which are used by the local ``classes`` generated for that
+        code. These classes are still part of the output."""
+        if classes:
+            code = "\n".join(str(cls) for cls in classes)
+            self.typing_names.update(
+                name for name in names if re.search(r"\b" + name + r"\b", code)
+            )
+
     def is_known_type(self, typename: str) -> bool:
-        for type_set in self.known_types:
-            if typename in type_set:
-                return True
-        return False
+        return typename in self.known_types
 
     # def qualified_obj_name(self, pos: int=0, varname: bool=False) -> str:
     #     obj_name = self.obj_name[1:] if len(self.obj_name) > 1 else self.obj_name
@@ -164,21 +404,83 @@ class TS2PyCompiler(Compiler):
     #     return '.'.join(obj_name)
 
     def prepare(self, root: Node) -> None:
+        # The configuration is read here rather than in reset(), because
+        # a compiler is not reset before its first call and the (thread-
+        # local) configuration may change between two calls.
+        bcn = get_config_value("ts2py.BaseClassName", "TypedDict")
+        i = bcn.rfind(".")
+        if i >= 0:
+            self.additional_imports = f"\nfrom {bcn[:i]} import {bcn[i + 1:]}\n"
+            bcn = bcn[i + 1 :]
+        else:
+            self.additional_imports = ""
+        self.base_class_name = bcn
+        self.class_decorator = get_config_value("ts2py.ClassDecorator", "").strip()
+        if self.class_decorator:
+            if self.class_decorator[0] != "@":
+                self.class_decorator = "@" + self.class_decorator
+            self.class_decorator += "\n"
+        self.use_enums = get_config_value("ts2py.UseEnum", True)
+        self.use_type_union = get_config_value("ts2py.UseTypeUnion", False)
+        self.use_literal_type = get_config_value("ts2py.UseLiteralType", True)
+        self.use_not_required = get_config_value("ts2py.UseNotRequired", False)
+
         # Using 'str(nd["identifier"])' instead of 'nd["identifier"].content'
         type_aliases = {
             str(nd["identifier"]) for nd in root.select_children("type_alias")
         }
         namespaces = {str(nd["identifier"]) for nd in root.select_children("namespace")}
         self.overloaded_type_names = type_aliases & namespaces
+        if self.imports:
+            self.imported = self.imports.symbols
+            self.known_types.update(self.imported.types)
+            self.typed_dicts.update(self.imported.typed_dicts)
+
+    def __call__(self, root: Node) -> Any:
+        try:
+            return super().__call__(root)
+        finally:
+            # The caller holds on to the syntax tree, as long as it needs it.
+            self.tree = ROOTNODE_PLACEHOLDER
+            self.type_names_below = {}
+            self.resolved_bases = {}
+
+    def symbols(self) -> ModuleSymbols:
+        """Returns the types declared on the top level of the last compiled
+        module, not counting the imported types."""
+        types = self.known_types.toplevel() - PREDEFINED_TYPES - self.imported.types
+        return ModuleSymbols(
+            frozenset(types),
+            frozenset(self.typed_dicts & types),
+            frozenset(self.referenced_types - types),
+        )
+
+    def stream(self, root: Node, write: Callable[[str], Any]) -> str:
+        """
+        Compiles ``root`` like calling the compiler does, but passes the code
+        of every top-level declaration to ``write`` as soon as it has been
+        compiled. Returns the import header that must precede this code.
+        """
+        self.sink = WhitespaceNormalizer(write)
+        try:
+            return self(root)
+        finally:
+            self.sink = None
 
     def finalize(self, python_code: Any) -> Any:
         code_blocks = []
         if self.tree.name == "document":
-            code_blocks.append(get_typing_imports(python_code))
+            code_blocks.append(get_typing_imports(self.typing_names))
+            if self.imports and self.imports.code:
+                code_blocks.append(self.imports.code)
+        if self.sink is not None:
+            # everything but the code of an ambient module has been streamed
+            if python_code:
+                self.sink("\n\n" + python_code if code_blocks else python_code)
+            self.sink.flush()
+            return "\n\n".join(code_blocks)
         code_blocks.append(python_code)
-        cooked = "\n\n".join(code_blocks)
-        cooked = re.sub(" +(?=\n)", "", cooked)
-        return re.sub(r"\n\n\n+", "\n\n\n", cooked)
+        return normalize_whitespace("\n\n".join(code_blocks))
 
     def on_EMPTY__(self) -> str:
         return ""
@@ -201,11 +503,19 @@ class TS2PyCompiler(Compiler):
             )
             return self.compile(node["module"][0]["document"])
         self.mark_overloaded_functions(node)
-        return "\n\n".join(
-            self.compile(child)
+        blocks = (
+            str(self.compile(child))
             for child in node.children
             if child.name != "declaration"
         )
+        if self.sink is not None and node is self.tree:
+            self.sink("\n\n")  # separates the import header from the code
+            for i, block in enumerate(blocks):
+                if i:
+                    self.sink("\n\n")
+                self.sink(block)
+            return ""
+        return "\n\n".join(blocks)
 
     def on_module(self, node) -> str:
         # name = self.compile(node["identifier"])
@@ -241,10 +551,13 @@ class TS2PyCompiler(Compiler):
             return decorator + f"class {name}({base_class_name}):\n"
         return decorator + f"class {name}:\n"
 
-    def render_local_classes(self) -> str:
+    def pop_local_classes(self) -> List[CodeBlock]:
         self.func_name = ""
-        classes = self.local_classes.pop()
-        return "\n".join(lc for lc in classes) + "\n" if classes else ""
+        return self.local_classes.pop()
+
+    def render_local_classes(self) -> str:
+        classes = self.pop_local_classes()
+        return "\n".join(str(lc) for lc in classes) + "\n" if classes else ""
 
     def process_type_parameters(self, node: Node) -> Tuple[str, str]:
         try:
@@ -252,13 +565,14 @@ class TS2PyCompiler(Compiler):
             type_parameters = self.compile(nd_type_parameters)
             type_parameters = type_parameters.strip("'")
             preface = f"{type_parameters} = TypeVar('{type_parameters}')\n"
-            self.known_types[-1].add(type_parameters)
+            self.typing_names.add("TypeVar")
+            self.known_types.add(type_parameters)
         except KeyError:
             type_parameters = ""
             preface = ""
         return type_parameters, preface
 
-    def on_interface(self, node) -> str:
+    def on_interface(self, node) -> CodeBlock:
         name = self.compile(node["identifier"])
         self.obj_name.append(name)
         self.scope_type.append("interface")
@@ -267,7 +581,7 @@ class TS2PyCompiler(Compiler):
         type_parameters, preface = self.process_type_parameters(node)
         preface += "\n"
         preface += node.get_attr("preface", "")
-        self.known_types.append(set())
+        self.known_types.push()
         base_class_list = []
         try:
             base_class_list = self.bases(node["extends"])
@@ -276,6 +590,8 @@ class TS2PyCompiler(Compiler):
                 base_classes += f", Generic[{type_parameters}]"
         except KeyError:
             base_classes = f"Generic[{type_parameters}]" if type_parameters else ""
+        if type_parameters:
+            self.typing_names.add("Generic")
         if any(bc not in self.typed_dicts for bc in base_class_list):
             force_base_class = " "
         elif "function" in node["declarations_block"]:
@@ -286,23 +602,29 @@ class TS2PyCompiler(Compiler):
         decls = self.compile(node["declarations_block"])
         interface = self.render_class_header(name, base_classes, force_base_class)
         self.base_classes[name] = base_class_list
-        interface += (
-            "    " + self.render_local_classes().replace("\n", "\n    ")
-        ).rstrip(" ")
+        body = CodeBlock(self.pop_local_classes(), indent=1)
+        body.lines.append(decls)
         self.known_types.pop()
-        self.known_types[-1].add(name)
+        self.known_types.add(name)
         self.scope_type.pop()
         self.obj_name.pop()
-        return preface + interface + "    " + decls.replace("\n", "\n    ")
+        return CodeBlock([preface + interface[:-1], body], name=name)
 
     # def on_type_parameter(self, node) -> str:  # OBSOLETE, see on_type_parameters()
     #     return self.compile(node['identifier'])
 
-    @lru_cache(maxsize=4)
     def bases(self, node) -> List[str]:
+        """Returns the base classes of an extends node, which are compiled
+        only once per compilation."""
         assert node.name == "extends"
-        bases = [self.compile(nd) for nd in node.children]
-        return [TYPE_NAME_SUBSTITUTION.get(bc, bc) for bc in bases]
+        bases = self.resolved_bases.get(id(node))
+        if bases is None:
+            bases = [
+                TYPE_NAME_SUBSTITUTION.get(bc, bc)
+                for bc in (self.compile(nd) for nd in node.children)
+            ]
+            self.resolved_bases[id(node)] = bases
+        return bases
 
     def on_extends(self, node) -> str:
         return ", ".join(self.bases(node))
@@ -313,7 +635,7 @@ class TS2PyCompiler(Compiler):
             self.basic_type_aliases.add(alias)
         self.obj_name.append(alias)
         if alias not in self.overloaded_type_names:
-            self.known_types[-1].add(alias)
+            self.known_types.add(alias)
             self.local_classes.append([])
             self.optional_keys.append([])
             types = self.compile(node["types"])
@@ -352,19 +674,20 @@ class TS2PyCompiler(Compiler):
     def on_declaration(self, node) -> str:
         identifier = self.compile(node["identifier"])
         self.obj_name.append(to_typename(identifier))
-        python_type = (
-            self.compile_type_expression(node, node["types"])
-            if "types" in node
-            else "Any"
-        )
+        if "types" in node:
+            python_type = self.compile_type_expression(node, node["types"])
+        else:
+            python_type = "Any"
+            self.typing_names.add("Any")
         typename = self.obj_name.pop()
-        if python_type[0:5] == "class":
+        if isinstance(python_type, CodeBlock):
             self.local_classes[-1].append(python_type)
             python_type = typename  # substitute typename for type
         if "optional" in node:
             self.optional_keys[-1].append(identifier)
             if self.use_not_required:
                 python_type = f"NotRequired[{python_type}]"
+                self.typing_names.add("NotRequired")
             else:
                 if python_type.startswith("Union["):
                     if python_type.find("None") < 0:
@@ -374,6 +697,7 @@ class TS2PyCompiler(Compiler):
                         python_type += "|None"
                 else:
                     python_type = f"Optional[{python_type}]"
+                    self.typing_names.add("Optional")
         if self.is_toplevel() and bool(self.local_classes[-1]):
             preface = self.render_local_classes()
             self.local_classes.append([])
@@ -391,6 +715,10 @@ class TS2PyCompiler(Compiler):
                 is_constructor = True
         else:  # anonymous function
             name = "__call__"
+        if is_constructor:
+            typing_names, self.typing_names = self.typing_names, set()
+            classes = self.local_classes[-1]
+            known_classes = len(classes)
         _tp, preface = self.process_type_parameters(node)
         try:
             arguments = self.compile(node["arg_list"])
@@ -402,6 +730,7 @@ class TS2PyCompiler(Compiler):
             return_type = self.compile(node["types"])
         except KeyError:
             return_type = "Any"
+            self.typing_names.add("Any")
         decorator = node.get_attr("decorator", "")
         if decorator:
             if decorator.endswith(".register"):
@@ -411,17 +740,20 @@ class TS2PyCompiler(Compiler):
             f"{preface}\n{decorator}def {name}({arguments}) -> {return_type}:\n    pass"
         )
         if is_constructor:
-            interface = pick_from_path(self.path, "interface", reverse=True)
+            interface = self.context.innermost("interface")
             assert interface
             interface.attr["preface"] = "".join(
                 [interface.get_attr("preface", ""), pyfunc, "\n"]
             )
+            # the preface of the interface has already been rendered
+            dropped_typing_names, self.typing_names = self.typing_names, typing_names
+            self.keep_typing_names(dropped_typing_names, classes[known_classes:])
             return ""
         return pyfunc
 
     def on_arg_list(self, node) -> str:
-        breadcrumb = "/".join(nd.name for nd in self.path)
-        if breadcrumb.rfind("func_type") > breadcrumb.rfind("function"):
+        enclosing = self.context.innermost("function", "func_type")
+        if enclosing is not None and enclosing.name == "func_type":
             arg_list = [self.compile(nd) for nd in node.children]
             if any(arg[0:1] == "*" for arg in arg_list):
                 return "..."
@@ -444,6 +776,7 @@ class TS2PyCompiler(Compiler):
             self.obj_name.pop()
             if "optional" in node:
                 types = f"Optional[{types}] = None"
+                self.typing_names.add("Optional")
             return f"{argname}: {types}"
         return f"{argname} = None" if "optional" in node else argname
 
@@ -455,7 +788,9 @@ class TS2PyCompiler(Compiler):
 
     def on_types(self, node) -> str:
         union = []
+        seen: Set[str] = set()
         i = 0
+        unknown_types = self.unknown_types(node)
         for current_node in node.children:
             obj_name_stub = self.obj_name[-1]
             name_index = obj_name_stub.rfind("_")
@@ -464,17 +799,16 @@ class TS2PyCompiler(Compiler):
                 obj_name_stub = obj_name_stub[:name_index]
             fname = self.func_name[:1].upper() + self.func_name[1:]
             self.obj_name[-1] = fname + obj_name_stub + "_" + str(i)
-            typ = self.compile_type_expression(node, current_node)
-            if typ not in union:
+            typ = self.compile_type_expression(node, current_node, unknown_types)
+            if typ not in seen:
+                seen.add(typ)
                 union.append(typ)
                 i += 1
             self.obj_name[-1] = obj_name_stub
         for i, typ in enumerate(union):
-            if typ[0:5] == "class":
-                match_str = re.match(r"class\s*(\w+)[\w(){},' =]*\s*:", typ)
-                cname = match_str.group(1) if match_str else ""
+            if isinstance(typ, CodeBlock):
                 self.local_classes[-1].append(typ)
-                union[i] = cname
+                union[i] = typ.name
         if self.is_toplevel():
             preface = self.render_local_classes()
             self.local_classes.append([])
@@ -485,33 +819,36 @@ class TS2PyCompiler(Compiler):
             nd[0].name == "literal" for nd in node.children
         ):
             assert all(nd[0].name == "literal" for nd in node.children)
+            self.typing_names.add("Literal")
             return f"Literal[{', '.join(union)}]"
         if self.use_type_union or len(union) <= 1:
             return preface + "|".join(union)
+        self.typing_names.add("Union")
         return preface + f"Union[{', '.join(union)}]"
 
-    def on_type(self, node) -> str:
+    def on_type(self, node) -> Union[str, CodeBlock]:
         assert len(node.children) == 1
         typ = node[0]
         if typ.name == "declarations_block":
             self.local_classes.append([])
             self.optional_keys.append([])
             decls = self.compile(typ)
-            return "".join(
-                [
-                    self.render_class_header(self.obj_name[-1], "") + "    ",
-                    self.render_local_classes().replace("\n", "\n    "),
-                    decls.replace("\n", "\n    "),
-                ]
-            )  # maybe add one '\n'?
+            name = self.obj_name[-1]
+            header = self.render_class_header(name, "")[:-1]
+            body = CodeBlock(self.pop_local_classes(), indent=1)
+            body.lines.append(decls)
+            return CodeBlock([header, body], name=name)
             # return 'Dict'
         if typ.name == "literal":
             literal_typ = typ[0].name
             if self.use_literal_type:
+                self.typing_names.add("Literal")
                 return f"Literal[{self.compile(typ)}]"
             if literal_typ == "array":
+                self.typing_names.add("List")
                 return "List"
             if literal_typ == "object":
+                self.typing_names.add("Dict")
                 return "Dict"
             if literal_typ in ("number", "integer"):
                 literal = self.compile(typ)
@@ -526,6 +863,7 @@ class TS2PyCompiler(Compiler):
         return self.compile(typ)
 
     def on_type_tuple(self, node):
+        self.typing_names.add("Tuple")
         return "Tuple[" + ", ".join(self.compile(nd) for nd in node) + "]"
 
     def on_mapped_type(self, node) -> str:
@@ -534,19 +872,30 @@ class TS2PyCompiler(Compiler):
     def on_map_signature(self, node) -> str:
         node_index_signature = self.compile(node["index_signature"])
         node_types = self.compile(node["types"])
+        self.typing_names.add("Dict")
         return f"Dict[{node_index_signature}, {node_types}]"
 
     def on_func_type(self, node) -> str:
         if "arg_list" in node:
+            typing_names, self.typing_names = self.typing_names, set()
+            classes = self.local_classes[-1]
+            known_classes = len(classes)
             arg_list = self.compile(node["arg_list"])
+            arg_typing_names, self.typing_names = self.typing_names, typing_names
             if arg_list.find("= None") >= 0 or arg_list.find("*") >= 0:
                 # See https://docs.python.org/3/library/typing.html#typing.Callable
                 args = "..."
             else:
                 args = f"[{arg_list}]"
+            if args == "..." or arg_list == "...":
+                # the argument types are dropped
+                self.keep_typing_names(arg_typing_names, classes[known_classes:])
+            else:
+                self.typing_names.update(arg_typing_names)
         else:
             args = "[]"
         types = self.compile(node["types"])
+        self.typing_names.add("Callable")
         return f"Callable[{args}, {types}]"
 
     def on_intersection(self, node) -> str:
@@ -556,15 +905,16 @@ class TS2PyCompiler(Compiler):
             "Type intersections are not yet implemented",
             NOT_YET_IMPLEMENTED_WARNING,
         )
+        self.typing_names.add("Any")
         return "Any"
 
-    def on_virtual_enum(self, node) -> str:
+    def on_virtual_enum(self, node) -> Union[str, CodeBlock]:
         name = self.compile(node["identifier"])
         if self.is_known_type(name):
             # self.tree.new_error(node,
             #     f'Name {name} has already been defined earlier!', WARNING)
             return ""
-        self.known_types[-1].add(name)
+        self.known_types.add(name)
         save = self.strip_type_from_const
         if all(child.name == "const" for child in node.children[1:]):
             if all(
@@ -585,25 +935,21 @@ class TS2PyCompiler(Compiler):
             header = self.render_class_header(name, "")[
                 :-1
             ]  # leave out the trailing "\n"
-        namespace.insert(0, header)
         self.strip_type_from_const = save
-        return "\n    ".join(namespace)
+        if not namespace:
+            return header
+        return CodeBlock([header, CodeBlock(namespace, indent=1)])
 
-    def on_namespace(self, node) -> str:
+    def on_namespace(self, node) -> CodeBlock:
         # errmsg = "Transpilation of namespaces that contain more than just " \
         #          "constant definitions has not yet been implemented."
         # self.tree.new_error(node, errmsg, NOT_YET_IMPLEMENTED_WARNING)
         # return "# " + errmsg
         name = self.compile(node["identifier"])
-        declarations = [f"class {name}:"]
         assert len(node.children) >= 2
-        declaration = self.compile(node[1])
-        declaration = declaration.lstrip("\n")
-        declarations.extend(declaration.split("\n"))
-        for current_node in node[2:]:
-            declaration = self.compile(current_node)
-            declarations.extend(declaration.split("\n"))
-        return "\n    ".join(declarations)
+        declarations = [self.compile(current_node) for current_node in node[1:]]
+        declarations[0] = declarations[0].lstrip("\n")
+        return CodeBlock([f"class {name}:", CodeBlock(declarations, indent=1)])
 
     def on_enum(self, node) -> str:
         if self.use_enums:
@@ -618,7 +964,7 @@ class TS2PyCompiler(Compiler):
         else:
             base_class = ""
         name = self.compile(node["identifier"])
-        self.known_types[-1].add(name)
+        self.known_types.add(name)
         enum = ["class " + name + base_class + ":"]
         for item in node.select_children("item"):
             enum.append(self.compile(item))
@@ -678,7 +1024,9 @@ class TS2PyCompiler(Compiler):
         return node.content
 
     def on_basic_type(self, node) -> str:
-        return TYPE_NAME_SUBSTITUTION[node.content]
+        python_type = TYPE_NAME_SUBSTITUTION[node.content]
+        self.add_typing_names(python_type)
+        return python_type
 
     def on_generic_type(self, node) -> str:
         base_type = self.compile(node["type_name"])
@@ -719,22 +1067,39 @@ class TS2PyCompiler(Compiler):
 
     def on_type_name(self, node) -> str:
         name = self.compile(node["identifier"])
-        return TYPE_NAME_SUBSTITUTION.get(name, name)
-
-    def compile_type_expression(self, node, type_node):
-        unknown_types = set(
-            tn.content
-            for tn in node.select("type_name")
-            if not self.is_known_type(tn.content)
-        )
+        self.referenced_types.add(name)
+        python_type = TYPE_NAME_SUBSTITUTION.get(name, name)
+        self.add_typing_names(python_type)
+        return python_type
+
+    def type_names(self, node) -> FrozenSet[str]:
+        """Returns the contents of the type_name nodes below ``node``. Every
+        subtree is only scanned once, however deeply it is nested."""
+        names = self.type_names_below.get(id(node))
+        if names is None:
+            collected: Set[str] = set()
+            for child in node.children:
+                if child.name == "type_name":
+                    collected.add(child.content)
+                elif child.children:
+                    collected.update(self.type_names(child))
+            names = frozenset(collected)
+            self.type_names_below[id(node)] = names
+        return names
+
+    def unknown_types(self, node) -> Set[str]:
+        return {name for name in self.type_names(node) if not self.is_known_type(name)}
+
+    def compile_type_expression(
+        self, node, type_node, unknown_types: Optional[Set[str]] = None
+    ):
+        if unknown_types is None:
+            unknown_types = self.unknown_types(node)
         type_expression = self.compile(type_node)
-        for typ in unknown_types:
-            rx_pattern = re.compile(r"(?:(?<=[^\w'])|^)" + typ + r"(?:(?=[^\w'])|$)")
-            segments = type_expression.split("'")
-            for i in range(0, len(segments), 2):
-                segments[i] = rx_pattern.sub(f"'{typ}'", segments[i])
-            type_expression = "'".join(segments)
-            # type_expression = rx.sub(f"'{typ}'", type_expression)
+        if isinstance(type_expression, CodeBlock):
+            # forward references in the class have been quoted already
+            return type_expression
+        type_expression = quote_forward_references(type_expression, unknown_types)
         if type_expression[0:1] == "'":
             type_expression = "".join(["'", type_expression.replace("'", ""), "'"])
         return type_expression
@@ -742,6 +1107,7 @@ class TS2PyCompiler(Compiler):
     def on_array_of(self, node) -> str:
         assert len(node.children) == 1
         element_type = self.compile_type_expression(node, node[0])
+        self.typing_names.add("List")
         return "List[" + element_type + "]"
 
     def on_array_types(self, node) -> str:
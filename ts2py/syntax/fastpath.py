@@ -0,0 +1,625 @@
+"""A fast path for the common subset of the ts2py grammar.
+
+Most declaration files consist of nothing but interfaces, type aliases and
+enums. ``parse_subset()`` parses such files with a hand-written lexer and
+recursive descent parser into exactly the syntax tree that ``TS2PyGrammar``
+yields, including the node positions. The alternatives are tried in the
+same order as by the grammar, so that the result does not differ where the
+grammar is ambiguous. Whenever the parser meets anything outside of the
+subset, any syntax error, or a word that DHParser would split because it
+starts with a keyword (e.g. ``stringList`` or ``readonlyFoo``), it gives up
+and ``FastPathParser`` falls back on the grammar.
+"""
+
+import re
+from typing import Any, Callable, List, Optional, Tuple
+from DHParser import Node, RootNode
+from ts2py.syntax.parser import TS2PyGrammar
+
+BASIC_TYPES = (
+    "object",
+    "array",
+    "string",
+    "number",
+    "boolean",
+    "null",
+    "integer",
+    "uinteger",
+    "decimal",
+    "unknown",
+    "any",
+    "void",
+)
+BOOLEANS = ("true", "false")
+
+RX_WHITESPACE = re.compile(TS2PyGrammar.WSP_RE__)
+RX_TOKEN = re.compile(
+    r"(?P<word>(?!\d)\w+(?:\.(?!\d)\w+)*)"
+    r"|(?P<number>-?(?:[1-9][0-9]+|[0-9])(?:\.[0-9]+)?(?:[Ee][+-]?[0-9]+)?)"
+    r"|(?P<string>\"[^\"\n]*\"|'[^'\n]*')"
+    r"|(?P<punctuation>\[\]|=>|\.\.\.|[{}\[\]()<>,;:|&=?])"
+)
+RX_OUTSIDE_SUBSET = re.compile(
+    r"^[ \t]*(?:export[ \t]+)?(?:declare|namespace|module|const|function|import)\b",
+    re.MULTILINE,
+)
+RX_NUMBER_TAIL = re.compile(r"[\w.]")
+RX_IDENTIFIER = re.compile(r"(?!\d)\w+(?:\.(?!\d)\w+)*$")
+
+Token = Tuple[str, str, int]  # kind (or the punctuation itself), text, position
+
+
+class Unsupported(Exception):
+    """Raised if the source is not (certainly) parsed like by the grammar."""
+
+
+def tokenize(text: str) -> List[Token]:
+    tokens = []
+    length = len(text)
+    pos = RX_WHITESPACE.match(text).end()
+    while pos < length:
+        match = RX_TOKEN.match(text, pos)
+        if not match:
+            raise Unsupported
+        kind = match.lastgroup
+        end = match.end()
+        if kind == "number" and RX_NUMBER_TAIL.match(text, end):
+            raise Unsupported
+        token = match.group()
+        tokens.append((token if kind == "punctuation" else kind, token, pos))
+        pos = RX_WHITESPACE.match(text, end).end()
+    tokens.append(("EOF", "", length))
+    return tokens
+
+
+def keyword(word: str, keywords: Tuple[str, ...]) -> Optional[str]:
+    """Returns the keyword ``word`` is equal to, if any. Words that merely
+    start with a keyword are not supported, because DHParser matches the
+    keyword and continues right behind it."""
+    for kw in keywords:
+        if word.startswith(kw):
+            if word == kw:
+                return kw
+            raise Unsupported
+    return None
+
+
+def new_node(name: str, result: Any, pos: int) -> Node:
+    node = Node(name, result)
+    node._pos = pos  # pylint: disable=protected-access
+    return node
+
+
+def move(node: Node, pos: int) -> Node:
+    """Moves a node to the position of the anonymous parser that passed it
+    through, as DHParser does."""
+    node._pos = pos  # pylint: disable=protected-access
+    return node
+
+
+class SubsetParser:
+    """Recursive descent parser for interfaces, type aliases and enums. The
+    methods return None where the grammar would backtrack and raise
+    ``Unsupported`` in all other cases of doubt."""
+
+    def __init__(self, text: str):
+        self.tokens = tokenize(text)
+        self.i = 0
+
+    def kind(self, ahead: int = 0) -> str:
+        return self.tokens[min(self.i + ahead, len(self.tokens) - 1)][0]
+
+    def text(self) -> str:
+        return self.tokens[self.i][1]
+
+    def pos(self) -> int:
+        return self.tokens[self.i][2]
+
+    def advance(self) -> int:
+        pos = self.tokens[self.i][2]
+        self.i += 1
+        return pos
+
+    def expect(self, kind: str) -> int:
+        if self.kind() != kind:
+            raise Unsupported
+        return self.advance()
+
+    def word(self, keywords: Tuple[str, ...]) -> Optional[str]:
+        return keyword(self.text(), keywords) if self.kind() == "word" else None
+
+    def optional(self, parse: Callable[[], Optional[Node]]) -> Optional[Node]:
+        """Calls ``parse`` and restores the position, if it fails."""
+        start = self.i
+        node = parse()
+        if node is None:
+            self.i = start
+        return node
+
+    # document
+
+    def document(self) -> Node:
+        items = []
+        while self.kind() != "EOF":
+            start = self.pos()
+            if self.word(("export",)):
+                self.advance()
+            declaration = self.word(("interface", "class", "type", "enum"))
+            if declaration is None:
+                raise Unsupported
+            self.advance()
+            if declaration == "type":
+                items.append(self.type_alias(start))
+            elif declaration == "enum":
+                items.append(self.enum(start))
+            else:
+                items.append(self.interface(start))
+        return new_node("document", tuple(items) or "", 0)
+
+    def interface(self, start: int) -> Node:
+        children = [self.identifier()]
+        if self.kind() == "<":
+            children.append(self.type_parameters())
+        if self.word(("extends",)):
+            children.append(self.extends())
+        if self.kind() != "{":
+            raise Unsupported
+        block = self.declarations_block()
+        if block is None:
+            raise Unsupported
+        children.append(block)
+        return new_node("interface", tuple(children), start)
+
+    def extends(self) -> Node:
+        start = self.advance()
+        children = [self.generic_or_type_name()]
+        while self.kind() == ",":
+            comma = self.advance()
+            children.append(move(self.generic_or_type_name(), comma))
+        return new_node("extends", tuple(children), start)
+
+    def type_alias(self, start: int) -> Node:
+        children = [self.identifier()]
+        if self.kind() == "<":
+            children.append(self.type_parameters())
+        self.expect("=")
+        types = self.types()
+        if types is None:
+            raise Unsupported
+        children.append(types)
+        self.expect(";")
+        return new_node("type_alias", tuple(children), start)
+
+    def enum(self, start: int) -> Node:
+        children = [self.identifier()]
+        self.expect("{")
+        children.append(self.enum_item())
+        while self.kind() == "," and self.kind(1) != "}":
+            comma = self.advance()
+            children.append(move(self.enum_item(), comma))
+        if self.kind() == ",":
+            self.advance()
+        self.expect("}")
+        return new_node("enum", tuple(children), start)
+
+    def enum_item(self) -> Node:
+        start = self.pos()
+        if self.kind() == "string":
+            name = self.text()[1:-1]
+            if not RX_IDENTIFIER.match(name) or name.startswith(BOOLEANS):
+                raise Unsupported
+            self.advance()
+            children = [new_node("identifier", name, start)]
+        else:
+            children = [self.identifier()]
+        if self.kind() == "=":
+            equals = self.advance()
+            children.append(move(self.literal(), equals))
+        return new_node("item", tuple(children), start)
+
+    # declarations
+
+    def declarations_block(self) -> Optional[Node]:
+        start = self.advance()
+        children = []
+        item = self.optional(self.block_item)
+        if item is not None:
+            children.append(item)
+            while True:
+                restart = self.i
+                separator = self.pos()
+                if self.kind() == ";":
+                    self.advance()
+                item = self.block_item()
+                if item is None:
+                    self.i = restart
+                    break
+                children.append(move(item, separator))
+            if self.kind() == ";":
+                restart = self.i
+                separator = self.advance()
+                signature = self.map_signature()
+                if signature is None:
+                    self.i = restart
+                else:
+                    children.append(move(signature, separator))
+            if self.kind() == ";":
+                self.advance()
+        if self.kind() != "}":
+            return None
+        self.advance()
+        return new_node("declarations_block", tuple(children) or "", start)
+
+    def block_item(self) -> Optional[Node]:
+        start = self.pos()
+        if self.kind() == "(":
+            return self.function(start, [])
+        if self.kind() != "word":
+            return None
+        qualifiers = []
+        if self.word(("readonly",)):
+            if self.kind(1) == "[":
+                return None  # the index signature of a map signature
+            if self.kind(1) != "word":
+                raise Unsupported
+            qualifiers.append(new_node("readonly", "readonly", self.advance()))
+        if self.word(("static", "function", "let", "var", "readonly")):
+            raise Unsupported
+        header = [self.identifier()]
+        if self.kind() == "?":
+            header.append(new_node("optional", "?", self.advance()))
+        if self.kind() in ("(", "<"):
+            if qualifiers:
+                raise Unsupported
+            return self.function(start, header)
+        children = [new_node("qualifiers", tuple(qualifiers) or "", start)] + header
+        if self.kind() == ":":
+            colon = self.advance()
+            types = self.types()
+            if types is None:
+                raise Unsupported
+            children.append(move(types, colon))
+        return new_node("declaration", tuple(children), start)
+
+    def function(self, start: int, header: List[Node]) -> Node:
+        children = list(header)
+        if self.kind() == "<":
+            children.append(self.type_parameters())
+        self.expect("(")
+        if self.kind() != ")":
+            children.append(self.arg_list())
+        self.expect(")")
+        if self.kind() == ":":
+            colon = self.advance()
+            types = self.types()
+            if types is None:
+                raise Unsupported
+            children.append(move(types, colon))
+        return new_node("function", tuple(children), start)
+
+    def arg_list(self) -> Node:
+        start = self.pos()
+        if self.kind() == "...":
+            return new_node("arg_list", (self.arg_tail(),), start)
+        children = [self.argument()]
+        while self.kind() == ",":
+            comma = self.advance()
+            if self.kind() == "...":
+                children.append(move(self.arg_tail(), comma))
+                break
+            children.append(move(self.argument(), comma))
+        return new_node("arg_list", tuple(children), start)
+
+    def argument(self) -> Node:
+        start = self.pos()
+        children = [self.identifier()]
+        if self.kind() == "?":
+            children.append(new_node("optional", "?", self.advance()))
+        if self.kind() == ":":
+            colon = self.advance()
+            types = self.types()
+            if types is None:
+                raise Unsupported
+            children.append(move(types, colon))
+        return new_node("argument", tuple(children), start)
+
+    def arg_tail(self) -> Node:
+        start = self.advance()
+        children = [self.identifier()]
+        if self.kind() == ":":
+            colon = self.advance()
+            array_of = self.array_of()
+            if array_of is None:
+                raise Unsupported
+            children.append(move(array_of, colon))
+        return new_node("arg_tail", tuple(children), start)
+
+    # types
+
+    def types(self) -> Optional[Node]:
+        start = self.pos()
+        first = self.intersection_or_type()
+        if first is None:
+            return None
+        children = [first]
+        while self.kind() == "|":
+            bar = self.advance()
+            alternative = self.intersection_or_type()
+            if alternative is None:
+                raise Unsupported
+            children.append(move(alternative, bar))
+        return new_node("types", tuple(children), start)
+
+    def intersection_or_type(self) -> Optional[Node]:
+        start = self.pos()
+        first = self.type()
+        if first is None or self.kind() != "&":
+            return first
+        children = [first]
+        while self.kind() == "&":
+            ampersand = self.advance()
+            component = self.type()
+            if component is None:
+                raise Unsupported
+            children.append(move(component, ampersand))
+        return new_node("intersection", tuple(children), start)
+
+    def type(self) -> Optional[Node]:
+        start = self.pos()
+        kind = self.kind()
+        if kind == "word":
+            if self.word(("readonly",)):
+                return new_node("type", self.array_of(), start)
+            if self.word(BOOLEANS):
+                return new_node("type", self.literal(), start)
+        elif kind == "{" and self.kind(1) in ("[", "word"):
+            mapped_type = self.optional(self.mapped_type)
+            if mapped_type is not None:
+                return new_node("type", mapped_type, start)
+        elif kind in ("string", "number", "[]"):
+            return new_node("type", self.literal(), start)
+        element = self.array_type_element()
+        if element is None:
+            return new_node("type", self.func_type(), start) if kind == "(" else None
+        if self.kind() == "[]":
+            self.advance()
+            return new_node("type", self.wrap_array_of(element, start, start), start)
+        return new_node("type", element, start)
+
+    def parenthesized_types(self) -> Optional[Node]:
+        start = self.advance()
+        types = self.types()
+        if types is None or self.kind() != ")":
+            return None
+        self.advance()
+        return move(types, start)
+
+    def func_type(self) -> Node:
+        start = self.advance()
+        children = []
+        if self.kind() != ")":
+            children.append(self.arg_list())
+        self.expect(")")
+        self.expect("=>")
+        types = self.types()
+        if types is None:
+            raise Unsupported
+        children.append(types)
+        return new_node("func_type", tuple(children), start)
+
+    def mapped_type(self) -> Optional[Node]:
+        start = self.advance()
+        signature = self.map_signature()
+        if signature is None:
+            return None
+        if self.kind() == ";":
+            self.advance()
+        if self.kind() != "}":
+            return None
+        self.advance()
+        return new_node("mapped_type", (signature,), start)
+
+    def map_signature(self) -> Optional[Node]:
+        start = self.pos()
+        signature = self.index_signature()
+        if signature is None or self.kind() != ":":
+            return None
+        self.advance()
+        types = self.types()
+        if types is None:
+            return None
+        return new_node("map_signature", (signature, types), start)
+
+    def index_signature(self) -> Optional[Node]:
+        start = self.pos()
+        children = []
+        if self.word(("readonly",)):
+            children.append(new_node("readonly", "readonly", self.advance()))
+        if self.kind() != "[" or self.kind(1) != "word":
+            return None
+        self.advance()
+        children.append(self.identifier())
+        if self.kind() == ":":
+            self.advance()
+        elif self.word(("in",)) and self.kind(1) == "word":
+            self.advance()
+            if not self.word(("keyof",)):
+                return None
+            self.advance()
+        else:
+            return None
+        element_type = self.type()
+        if element_type is None or self.kind() != "]":
+            return None
+        self.advance()
+        children.append(element_type)
+        return new_node("index_signature", tuple(children), start)
+
+    def array_type_element(self) -> Optional[Node]:
+        """Parses the alternatives of ``array_type`` and returns the node
+        that becomes the child of ``array_type`` or ``type``."""
+        kind = self.kind()
+        if kind == "word":
+            if keyword(self.text(), BASIC_TYPES):
+                return new_node("basic_type", self.text(), self.advance())
+            if self.word(("readonly",) + BOOLEANS):
+                raise Unsupported
+            return self.generic_or_type_name()
+        if kind == "(":
+            return self.optional(self.parenthesized_types)
+        if kind == "[":
+            return self.type_tuple()
+        if kind == "{":
+            block = self.declarations_block()
+            if block is None:
+                raise Unsupported  # an object literal, or an error
+            return block
+        return None
+
+    def array_of(self) -> Optional[Node]:
+        start = self.pos()
+        if self.word(("readonly",)):
+            self.advance()
+        elements_start = self.pos()
+        element = self.array_type_element()
+        if element is None or self.kind() != "[]":
+            raise Unsupported
+        self.advance()
+        return self.wrap_array_of(element, start, elements_start)
+
+    @staticmethod
+    def wrap_array_of(element: Node, start: int, elements_start: int) -> Node:
+        array_type = new_node("array_type", element, elements_start)
+        array_types = new_node("array_types", array_type, elements_start)
+        return new_node("array_of", array_types, start)
+
+    def type_tuple(self) -> Node:
+        start = self.advance()
+        types = self.types()
+        if types is None:
+            raise Unsupported  # an array literal, or an error
+        children = [types]
+        while self.kind() == ",":
+            comma = self.advance()
+            types = self.types()
+            if types is None:
+                raise Unsupported
+            children.append(move(types, comma))
+        self.expect("]")
+        return new_node("type_tuple", tuple(children), start)
+
+    def generic_or_type_name(self) -> Node:
+        start = self.pos()
+        type_name = new_node("type_name", self.identifier(), start)
+        if self.kind() == "<":
+            return new_node("generic_type", (type_name, self.type_parameters()), start)
+        return type_name
+
+    def type_parameters(self) -> Node:
+        start = self.advance()
+        children = [self.parameter_types()]
+        while self.kind() == ",":
+            comma = self.advance()
+            children.append(move(self.parameter_types(), comma))
+        self.expect(">")
+        return new_node("type_parameters", tuple(children), start)
+
+    def parameter_types(self) -> Node:
+        start = self.pos()
+        children = [self.parameter_type()]
+        while self.kind() == "|":
+            bar = self.advance()
+            children.append(move(self.parameter_type(), bar))
+        return new_node("parameter_types", tuple(children), start)
+
+    def parameter_type(self) -> Node:
+        start = self.pos()
+        if self.word(("readonly",)):
+            return new_node("parameter_type", self.array_of(), start)
+        element = self.array_type_element()
+        if element is None:
+            raise Unsupported
+        if self.kind() == "[]":
+            self.advance()
+            element = self.wrap_array_of(element, start, start)
+            return new_node("parameter_type", element, start)
+        if element.name == "types":
+            raise Unsupported  # a parenthesized type must be an array here
+        children = [element]
+        if element.name == "type_name":
+            if self.word(("extends",)):
+                children.append(self.type_constraint("extends_type"))
+            if self.kind() == "=":
+                children.append(self.type_constraint("equals_type"))
+        return new_node("parameter_type", tuple(children), start)
+
+    def type_constraint(self, name: str) -> Node:
+        start = self.advance()
+        if self.kind() != "word":
+            raise Unsupported
+        if keyword(self.text(), BASIC_TYPES):
+            bound = new_node("basic_type", self.text(), self.advance())
+        else:
+            bound_start = self.pos()
+            bound = new_node("type_name", self.identifier(), bound_start)
+        return new_node(name, bound, start)
+
+    # literals and identifiers
+
+    def literal(self) -> Node:
+        start = self.pos()
+        kind = self.kind()
+        if kind == "number":
+            number = self.text()
+            name = "number" if "." in number or "e" in number.lower() else "integer"
+            leaf = new_node(name, number, self.advance())
+        elif kind == "string":
+            leaf = new_node("string", self.text(), self.advance())
+        elif kind == "word" and self.word(BOOLEANS):
+            leaf = new_node("boolean", self.text(), self.advance())
+        elif kind == "[]":
+            leaf = new_node("array", "", self.advance())
+        else:
+            raise Unsupported
+        return new_node("literal", leaf, start)
+
+    def identifier(self) -> Node:
+        if self.kind() != "word" or self.text().startswith(BOOLEANS):
+            raise Unsupported
+        return new_node("identifier", self.text(), self.advance())
+
+
+def parse_subset(text: str) -> Optional[Node]:
+    """Returns the syntax tree of ``text`` or None, if ``text`` is not
+    entirely made up of the supported subset of the grammar."""
+    if RX_OUTSIDE_SUBSET.search(text):
+        return None  # spare the futile attempt
+    try:
+        return SubsetParser(text).document()
+    except (Unsupported, RecursionError):
+        return None
+
+
+class FastPathParser:
+    """
+    Drop-in replacement for a ``TS2PyGrammar`` object as parsing stage of
+    ``compile_source()``: Sources that ``parse_subset()`` can handle are
+    parsed by it, all others by the grammar. The fast path is not taken
+    while the grammar records its history or resume notices for debugging.
+    """
+
+    def __init__(self, grammar: TS2PyGrammar):
+        self.grammar = grammar
+
+    def __call__(self, document: str, source_mapping: Any = None) -> RootNode:
+        grammar = self.grammar
+        if not (grammar.history_tracking__ or grammar.resume_notices__):
+            tree = parse_subset(document)
+            if tree is not None:
+                root = RootNode().swallow(tree, document, source_mapping)
+                root.stage = "cst"
+                return root
+        return grammar(document, source_mapping=source_mapping)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.grammar, name)
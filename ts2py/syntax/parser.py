@@ -1,7 +1,9 @@
 import re
-from typing import List
+from typing import List, Optional, cast
 from DHParser import (
     Grammar,
+    Parser,
+    RootNode,
     Whitespace,
     Drop,
     Alternative,
@@ -23,7 +25,30 @@ from DHParser import (
     resume_notices_on,
     trace_history,
     ThreadLocalSingletonFactory,
+    SourceMapFunc,
 )
+from DHParser.parse import BlackHoleDict, MemoizationDict
+from ts2py.syntax import snapshot
+
+MEMOIZATION_POLICIES = ("on", "off", "bounded")
+
+
+class BoundedMemoizationDict(dict):
+    """A memoization dictionary that forgets its oldest entries when it
+    grows beyond ``bound`` entries. As the parser moves forward through the
+    document, these are the entries it is least likely to come back to."""
+
+    def __init__(self, bound: int):
+        super().__init__()
+        self.bound = bound
+
+    def __setitem__(self, key, value):
+        if len(self) >= self.bound:
+            del self[next(iter(self))]
+        super().__setitem__(key, value)
+
+    def __reduce__(self):
+        return self.__class__, (self.bound,)
 
 
 class TS2PyGrammar(Grammar):
@@ -471,8 +496,58 @@ class TS2PyGrammar(Grammar):
     }
     root__ = TreeReduction(_root, CombinedParser.MERGE_TREETOPS)
 
+    memoization_policy__ = ("on", 0)
+
+    def get_memoization_dict__(self, parser: Parser) -> MemoizationDict:
+        policy, bound = self.memoization_policy__
+        if policy == "off":
+            return self.memoization__.setdefault(parser.eq_class, BlackHoleDict())
+        if policy == "bounded":
+            return self.memoization__.setdefault(
+                parser.eq_class, BoundedMemoizationDict(bound)
+            )
+        return super().get_memoization_dict__(parser)
+
+    def __call__(
+        self,
+        document: str,
+        start_parser="root_parser__",
+        source_mapping: Optional[SourceMapFunc] = None,
+        *,
+        complete_match: bool = True,
+    ) -> RootNode:
+        """
+        Parses ``document`` with the memoization policy of the configuration
+        ("ts2py.Memoization" and "ts2py.MemoizationBound"). Afterwards, the
+        memoization tables are released right away, instead of keeping them
+        and the nodes they refer to until the next document is parsed.
+        """
+        policy = get_config_value("ts2py.Memoization", "on")
+        if policy not in MEMOIZATION_POLICIES:
+            raise ValueError(f"Unknown memoization policy '{policy}'")
+        self.memoization_policy__ = (
+            policy,
+            max(get_config_value("ts2py.MemoizationBound", 512), 1),
+        )
+        self._dirty_flag__ = True  # create the memoization dictionaries anew
+        try:
+            return super().__call__(
+                document, start_parser, source_mapping, complete_match=complete_match
+            )
+        finally:
+            for table in self.memoization__.values():
+                table.clear()
+            self.memoization__ = {}
+            self.tree__ = RootNode()
+
+
+def grammar_factory() -> TS2PyGrammar:
+    if get_config_value("ts2py.GrammarSnapshot", False):
+        return cast(TS2PyGrammar, snapshot.restore_grammar(TS2PyGrammar))
+    return TS2PyGrammar()
+
 
-_raw_grammar = ThreadLocalSingletonFactory(TS2PyGrammar)
+_raw_grammar = ThreadLocalSingletonFactory(grammar_factory)
 
 
 def get_grammar() -> TS2PyGrammar:
@@ -1,5 +1,6 @@
+import re
 from functools import partial
-from typing import Tuple, List
+from typing import NamedTuple, Tuple, List
 from DHParser import (
     ThreadLocalSingletonFactory,
     Error,
@@ -9,20 +10,88 @@ from DHParser import (
     make_preprocessor,
     chain_preprocessors,
 )
-from ts2py import types
+from ts2py.types import dhparser
 
 RE_INCLUDE = NEVER_MATCH_PATTERN
-# To capture includes, replace the NEVER_MATCH_PATTERN
-# by a pattern with group "name" here, e.g. r'\input{(?P<name>.*)}'
+# Imports are not included textually, which would parse a shared module once
+# for every file that imports it. Instead, ts2py_tokenizer() blanks them out
+# and the imported modules are compiled separately, cf. ts2py.modules.
+
+RX_IMPORT = re.compile(
+    r"^[ \t]*(?P<statement>import|export)"
+    r"(?:\s+(?P<clause>(?:type\s+)?(?:\*(?:\s+as\s+[\w$]+)?|\{[^}]*\}"
+    r"|[\w$]+(?:\s*,\s*(?:\{[^}]*\}|\*\s+as\s+[\w$]+))?))\s+from)?"
+    r"\s*(?P<quote>['\"])(?P<specifier>[^'\"\n]*)(?P=quote)[ \t]*;?",
+    re.MULTILINE,
+)
+RX_REFERENCE = re.compile(
+    r"^[ \t]*///[ \t]*<reference\s+path\s*=\s*(?P<quote>['\"])(?P<specifier>[^'\"\n]*)"
+    r"(?P=quote)\s*/>",
+    re.MULTILINE,
+)
+RX_IMPORT_NAME = re.compile(r"(?:type\s+)?([\w$]+)(?:\s+as\s+([\w$]+))?")
+
+
+class Import(NamedTuple):
+    """An import statement or a "/// <reference path>" directive."""
+
+    specifier: str  # the module as written, e.g. './a'
+    names: Tuple[Tuple[str, str], ...]  # pairs of imported and local name
+    namespace: str  # local name of a namespace import "* as name", or ""
+    everything: bool  # all names, i.e. "export *" or a reference directive
+    reexport: bool  # "export ... from"
+
+
+def parse_import(match: re.Match) -> Import:
+    clause = match.group("clause") or ""
+    reexport = match.group("statement") == "export"
+    if clause.startswith("type"):
+        clause = clause[4:].lstrip()
+    names = []
+    namespace = ""
+    everything = False
+    braces = clause.find("{")
+    if braces >= 0:
+        for item in clause[braces + 1 : clause.find("}")].split(","):
+            name = RX_IMPORT_NAME.fullmatch(item.strip())
+            if name:
+                names.append((name.group(1), name.group(2) or name.group(1)))
+    star = clause.find("*")
+    if star >= 0:
+        alias = re.search(r"\bas\s+([\w$]+)", clause[star:])
+        if alias:
+            namespace = alias.group(1)
+        else:
+            everything = True
+    # default imports are ignored, since ts2py does not support default exports
+    return Import(
+        match.group("specifier"), tuple(names), namespace, everything, reexport
+    )
+
+
+def find_imports(source: str) -> List[Import]:
+    """Returns the imports and reference directives of a TypeScript source."""
+    imports = [parse_import(match) for match in RX_IMPORT.finditer(source)]
+    imports.extend(
+        Import(match.group("specifier"), (), "", True, False)
+        for match in RX_REFERENCE.finditer(source)
+    )
+    return imports
+
+
+def blank_out(match: re.Match) -> str:
+    return re.sub(r"[^\n]", " ", match.group(0))
 
 
 def ts2py_tokenizer(original_text) -> Tuple[str, List[Error]]:
-    # Here, a function body can be filled in that adds preprocessor tokens
-    # to the source code and returns the modified source.
-    return original_text, []
+    # Import statements are replaced by blanks, which leaves the positions
+    # of everything else unchanged.
+    if original_text.find("import") < 0 and original_text.find("from") < 0:
+        return original_text, []
+    return RX_IMPORT.sub(blank_out, original_text), []
 
 
-def preprocessor_factory() -> types.dhparser.PreprocessorFunc:
+def preprocessor_factory() -> dhparser.PreprocessorFunc:
     # below, the second parameter must always be the same as ts2pyGrammar.COMMENT__!
     find_next_include = gen_find_include_func(
         RE_INCLUDE, "(?:\\/\\/.*)|(?:\\/\\*(?:.|\\n)*?\\*\\/)"
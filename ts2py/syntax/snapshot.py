@@ -0,0 +1,153 @@
+"""Snapshots of an initialised grammar.
+
+Instantiating a DHParser grammar deep-copies the parser tree of its class
+and connects every parser to the new grammar object. A pickled snapshot of
+such a grammar restores considerably faster, so with the (opt-in) preset
+"ts2py.GrammarSnapshot" the first grammar of every thread and every worker
+process is restored from a snapshot file in the cache directory, which is
+(re-)written whenever it is missing or stale. As unpickling runs any code
+the file contains, the cache directory must not be writable by others.
+"""
+
+import io
+import os
+import sys
+import pickle
+import copyreg
+import threading
+from typing import Dict, FrozenSet, Optional, Type
+from DHParser import Grammar, get_config_value, md5
+from DHParser.versionnumber import __version__ as dhparser_version
+from ts2py.utils.config import CACHE_DIR
+
+# grammar attributes that are read from the configuration upon instantiation
+CONFIG_ATTRIBUTES = {
+    "left_recursion__": "left_recursion",
+    "history_tracking__": "history_tracking",
+    "resume_notices__": "resume_notices",
+    "max_parser_dropouts__": "max_parser_dropouts",
+    "reentry_search_window__": "reentry_search_window",
+}
+
+_snapshots: Dict[str, bytes] = {}  # snapshot file -> pickled grammar
+_snapshots_lock = threading.Lock()
+_module_hashes: Dict[str, str] = {}  # module name -> hash of its source
+
+
+def transient_attributes() -> FrozenSet[str]:
+    """Returns the names of the attributes that ``Grammar._reset__()``
+    initialises before every parser run. They are not part of a snapshot."""
+    probe = object.__new__(Grammar)
+    probe._reset__()  # pylint: disable=protected-access
+    return frozenset(probe.__dict__)
+
+
+def module_hash(module_name: str) -> str:
+    """Returns the hash of the source of a module, which is read only once.
+    It covers changes of the module that leave the grammar's source hash
+    unchanged, e.g. of the parsers that are defined in Python."""
+    with _snapshots_lock:
+        hash_value = _module_hashes.get(module_name)
+        if hash_value is None:
+            try:
+                file_name = sys.modules[module_name].__file__ or ""
+                with open(file_name, "r", encoding="utf-8") as module_file:
+                    hash_value = md5(module_file.read())
+            except (KeyError, OSError):
+                hash_value = f"source of {module_name} not found!?"
+            _module_hashes[module_name] = hash_value
+        return hash_value
+
+
+def snapshot_path(grammar_class: Type[Grammar]) -> str:
+    """The snapshot file of ``grammar_class``. Its name depends on the
+    grammar's source hash, on the source of the module that defines the
+    grammar and on the versions of DHParser and Python."""
+    key = md5(
+        grammar_class.__name__,
+        grammar_class.source_hash__,
+        module_hash(grammar_class.__module__),
+        dhparser_version,
+        sys.version,
+    )
+    return os.path.join(CACHE_DIR, f"grammar-{key}.pickle")
+
+
+def _restore(grammar_class: Type[Grammar]) -> Grammar:
+    return grammar_class.__new__(grammar_class)
+
+
+def dump_grammar(grammar: Grammar) -> bytes:
+    """Pickles a grammar that has not been used for parsing, yet."""
+    transient = transient_attributes()
+
+    def reduce_grammar(obj: Grammar):
+        state = {k: v for k, v in obj.__dict__.items() if k not in transient}
+        return _restore, (obj.__class__,), state
+
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[grammar.__class__] = reduce_grammar
+    pickler.dump(grammar)
+    return buffer.getvalue()
+
+
+def load_grammar(data: bytes) -> Grammar:
+    """Restores a grammar from the result of ``dump_grammar()``."""
+    grammar = pickle.loads(data)
+    grammar._reset__()  # pylint: disable=protected-access
+    for attribute, key in CONFIG_ATTRIBUTES.items():
+        setattr(grammar, attribute, get_config_value(key))
+    grammar_class = grammar.__class__
+    grammar.static_analysis_pending__ = grammar_class.static_analysis_pending__
+    grammar.static_analysis_errors__ = grammar_class.static_analysis_errors__
+    return grammar
+
+
+def save_snapshot(grammar: Grammar, path: str) -> None:
+    """Writes the snapshot of a pristine ``grammar`` atomically to ``path``."""
+    data = dump_grammar(grammar)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as snapshot_file:
+        snapshot_file.write(data)
+    os.replace(temp_path, path)
+    with _snapshots_lock:
+        _snapshots[path] = data
+
+
+def _read_snapshot(path: str) -> Optional[bytes]:
+    with _snapshots_lock:
+        data = _snapshots.get(path)
+        if data is None:
+            try:
+                with open(path, "rb") as snapshot_file:
+                    data = snapshot_file.read()
+            except OSError:
+                return None
+            _snapshots[path] = data
+        return data
+
+
+def restore_grammar(grammar_class: Type[Grammar]) -> Grammar:
+    """
+    Returns a new instance of ``grammar_class``, restored from its snapshot
+    if possible. Otherwise the grammar is instantiated and, if the cache
+    directory is writable, its snapshot is saved for the next time.
+    """
+    path = snapshot_path(grammar_class)
+    data = _read_snapshot(path)
+    if data is not None:
+        try:
+            grammar = load_grammar(data)
+            if isinstance(grammar, grammar_class):
+                return grammar
+        except Exception:  # pylint: disable=broad-except
+            pass  # unreadable or stale snapshot, it will be overwritten
+    grammar = grammar_class()
+    try:
+        save_snapshot(grammar, path)
+    except (OSError, pickle.PicklingError, AttributeError, TypeError):
+        pass
+    return grammar
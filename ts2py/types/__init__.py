@@ -1,2 +1,11 @@
-from ts2py.types import dhparser
+import importlib
+from typing import Any
 from ts2py.types import args
+
+
+def __getattr__(name: str) -> Any:
+    # the DHParser type aliases are only imported on first use, so that the
+    # command line starts up without DHParser
+    if name == "dhparser":
+        return importlib.import_module("ts2py.types.dhparser")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
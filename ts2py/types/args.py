@@ -10,6 +10,12 @@ class PythonCompatibilityArg(str, Enum):
     PYTHON311 = "3.11"
 
 
+class MemoizationArg(str, Enum):
+    ON = "on"
+    OFF = "off"
+    BOUNDED = "bounded"
+
+
 class PepArg(str, Enum):
     PEP435 = "435"
     PEP584 = "584"
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 FILE_PATH = Path(__file__)
@@ -6,6 +7,11 @@ MAIN_DIR = FILE_PATH.parent.parent.absolute()
 GRAMMAR_FILE = f"{MAIN_DIR}/assets/ts2py.ebnf"
 INI_FILE = f"{MAIN_DIR}/assets/ts2pyParser.ini"
 
+# Cached data that can be rebuilt at any time, e.g. grammar snapshots
+CACHE_DIR = os.environ.get("TS2PY_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache"), "ts2py"
+)
+
 # Colors
 SUCCESS_C = "\033[92m"
 DEBUG_C = "\033[93m"
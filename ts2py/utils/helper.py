@@ -1,5 +1,6 @@
 import os
 import sys
+import fnmatch
 from typing import List
 from ts2py import types
 from ts2py.utils.logger import Logger
@@ -45,3 +46,34 @@ def check_ts_extension(filenames: List[str]) -> None:
         if not filename.lower().endswith(".ts"):
             Logger().error(f"File '{filename}' does not end with the '.ts' extension")
             sys.exit(1)
+
+
+def matches_any(rel_path: str, name: str, patterns: List[str]) -> bool:
+    return any(
+        fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern)
+        for pattern in patterns
+    )
+
+
+def find_files(root: str, include: List[str], exclude: List[str]) -> List[str]:
+    """
+    Returns the files below ``root`` that match any of the ``include`` and
+    none of the ``exclude`` glob patterns, sorted by path. Patterns are
+    matched against the path relative to ``root`` as well as against the
+    plain name. Excluded directories are not descended into.
+    """
+    filenames = []
+    directories = [""]
+    while directories:
+        rel_dir = directories.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name)
+                if matches_any(rel_path, entry.name, exclude):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(rel_path)
+                elif entry.is_file() and matches_any(rel_path, entry.name, include):
+                    filenames.append(os.path.join(root, rel_path))
+    filenames.sort()
+    return filenames
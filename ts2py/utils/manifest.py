@@ -0,0 +1,105 @@
+import os
+import json
+from typing import Dict, List, Optional
+from ts2py.syntax.compiler import ModuleSymbols
+
+MANIFEST_FILE = ".ts2py_manifest.json"
+
+
+class Manifest:
+    """
+    On-disk record of the files converted within a directory. For every
+    file the hash of its source, the messages of its last conversion, its
+    top-level types and the types it imports from other files are stored,
+    so that files which have not changed since can be skipped, unless the
+    types they import have changed.
+    The whole manifest is discarded if the tool hash (grammar, compiler and
+    presets) differs from the one it was written with.
+    """
+
+    def __init__(self, directory: str, tool_hash: str):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_FILE)
+        self.tool_hash = tool_hash
+        self.entries: Dict[str, Dict] = {}
+        self.changed = False
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as manifest_file:
+                data = json.load(manifest_file)
+        except (FileNotFoundError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("tool_hash") == self.tool_hash:
+            self.entries = data.get("files", {})
+        else:
+            self.changed = True
+
+    def key(self, filename: str) -> str:
+        return os.path.relpath(os.path.abspath(filename), self.directory)
+
+    def lookup(self, filename: str, source_hash: str) -> Optional[List[str]]:
+        """
+        Returns the messages of the last conversion of ``filename``, if its
+        source hash is unchanged, or None if the file must be converted.
+        """
+        entry = self.entries.get(self.key(filename))
+        if entry and entry["source_hash"] == source_hash:
+            return entry["errors"]
+        return None
+
+    def symbols(self, filename: str) -> Optional[ModuleSymbols]:
+        """Returns the top-level types of ``filename`` after its last
+        conversion or None, if they have not been recorded."""
+        entry = self.entries.get(self.key(filename))
+        if not entry or "symbols" not in entry:
+            return None
+        return ModuleSymbols(
+            frozenset(entry["symbols"]["types"]),
+            frozenset(entry["symbols"]["typed_dicts"]),
+        )
+
+    def update(
+        self,
+        filename: str,
+        source_hash: str,
+        errors: List[str],
+        symbols: ModuleSymbols = ModuleSymbols(),
+        uses: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        """Records a conversion. ``uses`` maps the files that ``filename``
+        imports to the names of the types it takes from them."""
+        self.entries[self.key(filename)] = {
+            "source_hash": source_hash,
+            "errors": errors,
+            "symbols": {
+                "types": sorted(symbols.types),
+                "typed_dicts": sorted(symbols.typed_dicts),
+            },
+            "uses": {
+                self.key(dependency): names
+                for dependency, names in (uses or {}).items()
+            },
+        }
+        self.changed = True
+
+    def uses(self, filename: str) -> Optional[Dict[str, List[str]]]:
+        """Returns the files (as keys) that ``filename`` imported at its last
+        conversion and the names of the types it took from them."""
+        entry = self.entries.get(self.key(filename))
+        return entry.get("uses") if entry else None
+
+    def discard(self, filename: str) -> None:
+        if self.entries.pop(self.key(filename), None) is not None:
+            self.changed = True
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        data = {"tool_hash": self.tool_hash, "files": self.entries}
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(data, manifest_file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.changed = False
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+from DHParser import Error, ErrorCode, get_config_value, md5
+from ts2py.syntax.compiler import ModuleSymbols
+
+ENTRY_SUFFIX = ".ts2py"
+# the layout of the entries, part of every key
+ENTRY_FORMAT = "1"
+# temporary files of writers that have been interrupted are removed after
+STALE_SECONDS = 3600
+
+
+class ResultCache:
+    """
+    Content-addressed store of conversion results in a directory, which may
+    be shared by several processes or machines, e.g. on a network volume or
+    as a cache artifact of a CI pipeline. The key of an entry is a hash of
+    the source and of everything else the result depends on, so entries
+    never become stale and are only evicted to keep the cache below
+    ``max_size`` bytes, the least recently used first.
+    An entry consists of a JSON line with the error messages and the
+    top-level types of the source, followed by the generated code. Entries
+    are written to a temporary file first and then renamed, so that readers
+    never see a partially written entry.
+    """
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def key(source_text: str, *context: str) -> str:
+        return md5(ENTRY_FORMAT, source_text, *context)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ENTRY_SUFFIX)
+
+    def restore(
+        self, key: str, source: str, target: str
+    ) -> Optional[Tuple[List[Error], ModuleSymbols]]:
+        """
+        Writes the generated code of the entry ``key`` to ``target``, unless
+        it is the result of a conversion with fatal errors, and returns the
+        errors (as errors of ``source``) and the top-level types of the
+        result. Returns None, if there is no such entry.
+        """
+        path = self.path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as entry_file:
+                header = json.loads(entry_file.readline())
+                if not header["fatal"]:
+                    with open(target, "w", encoding="utf-8") as results_file:
+                        shutil.copyfileobj(entry_file, results_file)
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(path)  # for the eviction of the least recently used
+        except OSError:
+            pass  # e.g. a read-only cache
+        errors = [
+            Error(
+                message,
+                pos,
+                ErrorCode(code),
+                line,
+                column,
+                length,
+                orig_pos=orig_pos,
+                orig_doc=source,
+            )
+            for message, pos, code, line, column, length, orig_pos in header["errors"]
+        ]
+        symbols = header["symbols"]
+        return errors, ModuleSymbols(
+            frozenset(symbols["types"]),
+            frozenset(symbols["typed_dicts"]),
+            frozenset(symbols["references"]),
+        )
+
+    def store(
+        self,
+        key: str,
+        errors: List[Error],
+        fatal: bool,
+        symbols: ModuleSymbols,
+        target: Optional[str] = None,
+    ) -> None:
+        """Records the result of a conversion, the generated code of which
+        has been written to ``target``, unless ``fatal`` is set."""
+        header: Dict[str, Any] = {
+            "errors": [
+                [
+                    err.message,
+                    err.pos,
+                    int(err.code),
+                    err.line,
+                    err.column,
+                    err.length,
+                    err.orig_pos,
+                ]
+                for err in errors
+            ],
+            "fatal": fatal,
+            "symbols": {
+                "types": sorted(symbols.types),
+                "typed_dicts": sorted(symbols.typed_dicts),
+                "references": sorted(symbols.references),
+            },
+        }
+        path = self.path(key)
+        temp_path = ""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(".tmp", dir=os.path.dirname(path))
+            with open(handle, "w", encoding="utf-8") as entry_file:
+                entry_file.write(json.dumps(header) + "\n")
+                if not fatal and target:
+                    with open(target, "r", encoding="utf-8") as results_file:
+                        shutil.copyfileobj(results_file, entry_file)
+            os.replace(temp_path, path)
+        except OSError:
+            # the cache only saves time, a conversion never fails because of it
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def prune(self) -> None:
+        """Evicts the least recently used entries, until the cache is not
+        larger than ``max_size``."""
+        entries = []
+        total = 0
+        now = time.time()
+        try:
+            subdirectories = [
+                entry.path for entry in os.scandir(self.directory) if entry.is_dir()
+            ]
+        except OSError:
+            return
+        for subdirectory in subdirectories:
+            try:
+                for entry in os.scandir(subdirectory):
+                    stat = entry.stat()
+                    if entry.name.endswith(ENTRY_SUFFIX):
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+                    elif entry.name.endswith(".tmp") and (
+                        now - stat.st_mtime > STALE_SECONDS
+                    ):
+                        os.remove(entry.path)
+            except OSError:
+                continue
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_size:
+                break
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """The result cache in the directory "ts2py.ResultCache" or None, if
+    no directory has been configured."""
+    directory = get_config_value("ts2py.ResultCache", "")
+    if not directory:
+        return None
+    max_size = get_config_value("ts2py.ResultCacheSize", 256) * 1024 * 1024
+    return ResultCache(os.path.expanduser(directory), max_size)